@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import signals  # noqa: F401
+        if settings.PERF_INSTRUMENTATION:
+            from .metrics import instrument_serializers
+            instrument_serializers()
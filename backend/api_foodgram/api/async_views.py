@@ -0,0 +1,159 @@
+"""
+Асинхронное чтение под ASGI (SERVER_INTERFACE=asgi).
+
+ORM в Django 3.2 синхронный, поэтому каждый запрос к базе выполняется
+в отдельном потоке со своим соединением, а независимые запросы страницы
+(строки, количество, флаги пользователя) запускаются параллельно.
+Изменяющие запросы обслуживают обычные синхронные представления.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections
+from django.http import Http404
+from rest_framework.response import Response
+
+from .db import check_connections, mark_connections_used
+from .metrics import profile_queries
+
+
+def run_in_thread(func, *args, **kwargs):
+    def call():
+        check_connections()
+        try:
+            with profile_queries():
+                return func(*args, **kwargs)
+        finally:
+            mark_connections_used()
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def gather(*funcs):
+    return asyncio.gather(*(run_in_thread(func) for func in funcs))
+
+
+class AsyncReadMixin:
+    """
+    Под ASGI list и retrieve не блокируют цикл событий, остальные действия
+    ViewSet выполняются синхронно в отдельном потоке.
+    Под WSGI ничего не меняется.
+    """
+    async_actions = ('list', 'retrieve')
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        sync_view = super().as_view(actions, **initkwargs)
+        async_actions = {
+            method: action for method, action in actions.items()
+            if action in cls.async_actions
+        }
+        if not settings.ASYNC_VIEWS or not async_actions:
+            return sync_view
+        if 'get' in async_actions:
+            async_actions.setdefault('head', async_actions['get'])
+
+        async def view(request, *args, **kwargs):
+            action = async_actions.get(request.method.lower())
+            if action is None:
+                return await run_in_thread(
+                    sync_view, request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for method, name in actions.items():
+                setattr(self, method, getattr(self, name))
+            self.request = request
+            return await self.async_dispatch(
+                getattr(self, f'async_{action}'), request, *args, **kwargs)
+
+        view.cls = cls
+        view.initkwargs = initkwargs
+        view.actions = actions
+        view.csrf_exempt = True
+        return view
+
+    async def async_dispatch(self, handler, request, *args, **kwargs):
+        """Повторяет APIView.dispatch для асинхронного обработчика."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await run_in_thread(self.initial, request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(
+            request, response, *args, **kwargs)
+        return self.response
+
+    async def async_list(self, request, *args, **kwargs):
+        return await run_in_thread(self.list, request, *args, **kwargs)
+
+    async def async_retrieve(self, request, *args, **kwargs):
+        return await run_in_thread(self.retrieve, request, *args, **kwargs)
+
+
+class ConcurrentReadMixin(AsyncReadMixin):
+    """
+    Строки страницы, количество и связанные с ними данные
+    (get_related_queries) выбираются параллельно.
+    """
+
+    def get_related_queries(self, rows):
+        """Запросы, нужные для сериализации строк rows (подзапроса)."""
+        return {}
+
+    def set_related_results(self, instances, results):
+        pass
+
+    async def fetch(self, rows, *queries):
+        """Выбирает строки и связанные данные параллельно."""
+        related = self.get_related_queries(rows)
+        instances, *results = await gather(
+            lambda: list(rows),
+            *queries,
+            *(lambda query=query: list(query) for query in related.values()),
+        )
+        self.set_related_results(
+            instances, dict(zip(related, results[len(queries):])))
+        return instances, results[:len(queries)]
+
+    async def serialize(self, instances, **kwargs):
+        return await run_in_thread(
+            lambda: self.get_serializer(instances, **kwargs).data)
+
+    async def async_list(self, request, *args, **kwargs):
+        queryset = await run_in_thread(
+            lambda: self.filter_queryset(self.get_queryset()))
+        paginator = self.paginator
+        window = paginator and paginator.get_page_window(request)
+        if not window:
+            return await super().async_list(request, *args, **kwargs)
+        offset, limit = window
+        instances, (count,) = await self.fetch(
+            queryset[offset:offset + limit],
+            lambda: paginator.count_queryset(queryset),
+        )
+        paginator.set_page(queryset, instances, count)
+        data = await self.serialize(instances, many=True)
+        return paginator.get_paginated_response(data)
+
+    async def async_retrieve(self, request, *args, **kwargs):
+        queryset = await run_in_thread(
+            lambda: self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            rows = queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # Как get_object_or_404: /api/recipes/abc/ — 404, а не 500.
+            raise Http404
+        instances, _ = await self.fetch(rows)
+        if not instances:
+            raise Http404
+        self.check_object_permissions(request, instances[0])
+        return Response(await self.serialize(instances[0]))
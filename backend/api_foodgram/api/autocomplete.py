@@ -0,0 +1,74 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from api_foodgram.cache_versions import get_version
+from django.conf import settings
+from recipes.models import Ingredient
+
+TRIGRAM = 3
+
+
+def trigrams(text):
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+
+class IngredientIndex:
+    """
+    Отсортированный индекс названий ингредиентов в памяти процесса.
+    Поиск по началу названия идёт бинарным поиском, после него
+    добавляются совпадения в середине названия: их кандидаты берутся
+    из индекса триграмм, а не перебором всего каталога.
+    Индекс перестраивается при смене версии кеша ингредиентов.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.entries = ((), (), {})
+
+    def refresh(self):
+        version = get_version('ingredients')
+        if version == self.version:
+            return self.entries
+        rows = sorted(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            key=lambda row: (row[1].lower(), row[0]),
+        )
+        keys = tuple(name.lower() for _, name, _ in rows)
+        items = tuple(
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in rows
+        )
+        grams = defaultdict(list)
+        for position, key in enumerate(keys):
+            for gram in trigrams(key):
+                grams[gram].append(position)
+        self.entries = keys, items, dict(grams)
+        self.version = version
+        return self.entries
+
+    def search(self, query, limit=None):
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = query.lower()
+        keys, items, grams = self.refresh()
+        result = []
+        index = bisect_left(keys, query)
+        while (index < len(keys) and len(result) < limit
+               and keys[index].startswith(query)):
+            result.append(items[index])
+            index += 1
+        if len(query) < TRIGRAM:
+            candidates = range(len(keys))
+        else:
+            # Позиции по возрастанию, то есть в порядке названий.
+            candidates = min(
+                (grams.get(gram, ()) for gram in trigrams(query)), key=len)
+        for position in candidates:
+            if len(result) >= limit:
+                break
+            key = keys[position]
+            if query in key and not key.startswith(query):
+                result.append(items[position])
+        return result
+
+
+ingredient_index = IngredientIndex()
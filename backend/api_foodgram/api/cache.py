@@ -0,0 +1,206 @@
+import functools
+import hashlib
+import math
+import time
+
+from api_foodgram.cache_versions import get_version, object_prefix
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.http import http_date, parse_http_date_safe, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from .async_views import run_in_thread
+from .db import primary_reads
+
+
+def get_or_build(key, build, timeout):
+    """
+    Берёт значение из кеша, а при промахе строит его через build().
+    Строит только тот, кто взял блокировку; остальные ждут результата
+    до LOCK_TIMEOUT секунд и лишь потом строят сами, не сохраняя.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock = f'{key}:lock'
+    lock_timeout = settings.PAGE_CACHE_LOCK_TIMEOUT
+    deadline = time.monotonic() + lock_timeout
+    while not cache.add(lock, 1, lock_timeout):
+        if time.monotonic() >= deadline:
+            return build()
+        time.sleep(0.05)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    try:
+        value = cache.get(key)
+        if value is None:
+            value = build()
+            cache.set(key, value, timeout)
+    finally:
+        cache.delete(lock)
+    return value
+
+
+class CachedReadOnlyMixin:
+    """
+    Кеширует ответы list/retrieve и отвечает 304 по ETag/Last-Modified.
+    Кеш сбрасывается сменой версии через bump_version(cache_prefix).
+    """
+    cache_prefix = None
+
+    def is_not_modified(self, request, etag, version):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return etag in if_none_match or if_none_match.strip() == '*'
+        if_modified_since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since', ''))
+        # Дата в заголовке с точностью до секунды, а версия дробная:
+        # смена версии в ту же секунду не должна давать 304.
+        return (if_modified_since is not None
+                and math.ceil(version) <= if_modified_since)
+
+    def get_cache_path(self, request):
+        """Часть ключа и ETag, от которой зависит ответ."""
+        return request.get_full_path()
+
+    def cached_response(self, request, view, *args, **kwargs):
+        version = get_version(self.cache_prefix)
+        full_path = self.get_cache_path(request)
+        etag = '"{}"'.format(hashlib.md5(
+            f'{version}:{full_path}'.encode()).hexdigest())
+        if self.is_not_modified(request, etag, version):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'{self.cache_prefix}:{version}:{full_path}'
+            data = cache.get(key)
+            if data is None:
+                data = view(request, *args, **kwargs).data
+                cache.set(key, data, settings.CACHE_TTL)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs)
+
+
+class AnonymousPageCacheMixin:
+    """
+    Кеширует готовый JSON страниц list для анонимных пользователей.
+    Ключ — версия cache_prefix и нормализованные параметры запроса,
+    поэтому ?tags=a&tags=b и ?tags=b&tags=a попадают в одну запись.
+    Записи кеша строятся по основной базе, а не по реплике.
+    """
+    cache_prefix = None
+
+    def get_page_cache_key(self, request):
+        if (request.user.is_authenticated
+                or not settings.RECIPE_PAGE_CACHE_TTL
+                or request.accepted_renderer.format != 'json'):
+            return None
+        params = urlencode(sorted(
+            (name, sorted(values))
+            for name, values in request.query_params.lists()
+        ), doseq=True)
+        page = '|'.join((
+            request.scheme, request.get_host(), request.path,
+            request.accepted_media_type, params,
+        ))
+        return '{}:page:{}:{}'.format(
+            self.cache_prefix,
+            get_version(self.cache_prefix),
+            hashlib.md5(page.encode()).hexdigest(),
+        )
+
+    def render_page(self, request, response):
+        return request.accepted_renderer.render(
+            response.data, request.accepted_media_type,
+            self.get_renderer_context())
+
+    def build_page(self, request, *args, **kwargs):
+        # Отставшая реплика оставила бы старую страницу под новой версией.
+        with primary_reads():
+            return self.render_page(
+                request, super().list(request, *args, **kwargs))
+
+    def cached_page(self, request, key, *args, **kwargs):
+        content = get_or_build(
+            key,
+            functools.partial(self.build_page, request, *args, **kwargs),
+            settings.RECIPE_PAGE_CACHE_TTL,
+        )
+        return HttpResponse(
+            content, content_type=request.accepted_renderer.media_type)
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_page_cache_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+        return self.cached_page(request, key, *args, **kwargs)
+
+    async def async_list(self, request, *args, **kwargs):
+        key = await run_in_thread(self.get_page_cache_key, request)
+        if key is None:
+            return await super().async_list(request, *args, **kwargs)
+        return await run_in_thread(
+            self.cached_page, request, key, *args, **kwargs)
+
+
+class DetailCacheMixin:
+    """
+    Кеширует retrieve без данных текущего пользователя по версии объекта
+    (object_prefix(cache_prefix, pk)); их подставляет add_user_data.
+    Запросы с параметрами идут мимо кеша: фильтры и ?fields= меняют ответ.
+    Записи кеша строятся по основной базе, а не по реплике.
+    """
+    cache_prefix = None
+
+    def get_detail_cache_key(self, request):
+        pk = str(self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        if (not settings.RECIPE_DETAIL_CACHE_TTL or request.query_params
+                or not pk.isdigit()):
+            return None
+        host = hashlib.md5(
+            f'{request.scheme}|{request.get_host()}'.encode()).hexdigest()
+        return '{}:detail:{}:{}'.format(
+            object_prefix(self.cache_prefix, pk),
+            get_version(object_prefix(self.cache_prefix, pk)),
+            host,
+        )
+
+    def add_user_data(self, request, data):
+        return data
+
+    def build_detail(self, request, *args, **kwargs):
+        # Отставшая реплика оставила бы старую карточку под новой версией.
+        with primary_reads():
+            return dict(super().retrieve(request, *args, **kwargs).data)
+
+    def cached_detail(self, request, key, *args, **kwargs):
+        data = get_or_build(
+            key,
+            functools.partial(self.build_detail, request, *args, **kwargs),
+            settings.RECIPE_DETAIL_CACHE_TTL,
+        )
+        return Response(self.add_user_data(request, data))
+
+    def retrieve(self, request, *args, **kwargs):
+        key = self.get_detail_cache_key(request)
+        if key is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.cached_detail(request, key, *args, **kwargs)
+
+    async def async_retrieve(self, request, *args, **kwargs):
+        key = await run_in_thread(self.get_detail_cache_key, request)
+        if key is None:
+            return await super().async_retrieve(request, *args, **kwargs)
+        return await run_in_thread(
+            self.cached_detail, request, key, *args, **kwargs)
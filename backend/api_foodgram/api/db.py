@@ -0,0 +1,138 @@
+"""
+Соединения с базой: проверка живости постоянных соединений,
+чтение каталога с реплики и счётчики для мониторинга.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+counters = Counter()
+counters_lock = threading.Lock()
+
+
+def count(alias, name):
+    with counters_lock:
+        counters[alias, name] += 1
+
+
+def check_connections():
+    """
+    Закрывает постоянные соединения, которые перестали отвечать
+    (перезапуск базы, обрыв сети), чтобы запрос открыл новое.
+    Проверяются только соединения, простоявшие без дела дольше
+    DB_HEALTH_CHECK_IDLE секунд: у занятого воркера SELECT 1 перед каждым
+    запросом был бы лишним, а соединения с ошибками Django закрывает сам
+    в конце запроса.
+    """
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        idle = now - getattr(connection, 'last_used', 0.0)
+        if idle < settings.DB_HEALTH_CHECK_IDLE:
+            continue
+        if not connection.is_usable():
+            count(connection.alias, 'health_check_failures')
+            connection.close()
+
+
+def mark_connections_used():
+    """Запоминает, когда открытые соединения потока использовались."""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used = now
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Читает с основной базы, даже если запрос переключён на реплику."""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+def connection_metrics():
+    metrics = {}
+    for alias in settings.DATABASES:
+        connection = connections[alias]
+        with counters_lock:
+            stats = {
+                name: value for (key, name), value in counters.items()
+                if key == alias
+            }
+        metrics[alias] = {
+            'vendor': connection.vendor,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'connects': stats.get('connects', 0),
+            'health_check_failures': stats.get('health_check_failures', 0),
+        }
+        pool_stats = getattr(connection, 'pool_stats', None)
+        if pool_stats is not None:
+            metrics[alias]['pool'] = pool_stats()
+    return metrics
+
+
+class ReplicaRouter:
+    """
+    Пока выставлен replica_reads, чтение идёт с реплики.
+    Избранное, корзина, список покупок и подписки всегда читаются
+    с основной базы, чтобы пользователь сразу видел свои изменения.
+    """
+    primary_models = (
+        'recipes.favorite',
+        'recipes.shopingcart',
+        'recipes.shoppinglistitem',
+        'recipes.subscribe',
+    )
+
+    def db_for_read(self, model, **hints):
+        if not replica_reads.get():
+            return None
+        if model._meta.label_lower in self.primary_models:
+            return DEFAULT_DB_ALIAS
+        return settings.REPLICA_DATABASE
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == settings.REPLICA_DATABASE:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    list и retrieve читают с реплики, если она настроена.
+    Пользователь определяется до переключения, по основной базе.
+    Запросы с параметрами из primary_params (фильтры по избранному,
+    корзине и т. п. внутри основного запроса) остаются на основной базе,
+    чтобы пользователь сразу видел свои изменения.
+    """
+    replica_actions = ('list', 'retrieve')
+    primary_params = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (settings.REPLICA_DATABASE
+                and self.action in self.replica_actions
+                and not any(
+                    name in request.query_params
+                    for name in self.primary_params)):
+            replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        replica_reads.set(False)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -1,9 +1,14 @@
 import base64
+import binascii
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from recipes.images import RENDITIONS
 from rest_framework import serializers
 
+BASE64_CHUNK = 64 * 1024
+
 
 class Hex2NameColor(serializers.Field):
     def to_representation(self, value):
@@ -17,11 +22,62 @@ class Hex2NameColor(serializers.Field):
 
 
 class Base64ImageField(serializers.ImageField):
+    """
+    Принимает изображение в виде data URL. Строка декодируется частями
+    во временный файл на диске, размер ограничен настройкой MAX_IMAGE_SIZE.
+    """
+
+    def decode(self, imgstr, ext):
+        if len(imgstr) * 3 // 4 > settings.MAX_IMAGE_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения превышает допустимый.')
+        file = TemporaryUploadedFile(
+            'temp.' + ext, f'image/{ext}', 0, None)
+        try:
+            for start in range(0, len(imgstr), BASE64_CHUNK):
+                file.write(base64.b64decode(
+                    imgstr[start:start + BASE64_CHUNK], validate=True))
+        except binascii.Error:
+            file.close()
+            raise serializers.ValidationError(
+                'Некорректное изображение в base64.')
+        file.size = file.tell()
+        file.seek(0)
+        return file
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, ext)
 
         return super().to_internal_value(data)
+
+
+def file_url(storage, path, request):
+    """Ссылка на файл так же, как её строит FileField."""
+    url = storage.url(path)
+    if request is not None:
+        url = request.build_absolute_uri(url)
+    return url
+
+
+def rendition_urls(storage, image, renditions, request):
+    return {
+        name: file_url(storage, renditions.get(name) or image, request)
+        for name in RENDITIONS
+    }
+
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return rendition_urls(
+            recipe.image.storage, recipe.image.name, recipe.renditions,
+            self.context.get('request'))
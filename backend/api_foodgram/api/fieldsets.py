@@ -0,0 +1,91 @@
+"""
+Выборочные поля ответа: ?fields=id,name,image&expand=author.
+
+fields оставляет в объектах верхнего уровня только перечисленные поля,
+а вложенные объекты из них сворачивает до идентификаторов, если они
+не названы в expand. Без fields ответ не меняется. Представления
+по набору полей выбирают из базы только нужные столбцы и связи.
+"""
+from rest_framework import serializers
+
+
+def parse_list(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class Fieldset:
+    fields_param = 'fields'
+    expand_param = 'expand'
+
+    def __init__(self, fields=None, expand=()):
+        self.fields = fields
+        self.expand = set(expand)
+
+    @classmethod
+    def from_request(cls, request):
+        fields = request.query_params.get(cls.fields_param, '')
+        return cls(
+            parse_list(fields) or None,
+            parse_list(request.query_params.get(cls.expand_param, '')),
+        )
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        """Поле выводится и выводится целиком, а не идентификаторами."""
+        return self.fields is None or (
+            name in self.fields and name in self.expand)
+
+
+class SparseFieldsetMixin:
+    """Набор полей запроса для представления и его сериализаторов."""
+
+    @property
+    def fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = (
+                Fieldset.from_request(self.request)
+                if self.request.method == 'GET' else Fieldset())
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.fieldset
+        return context
+
+
+class SparseFieldsMixin:
+    """
+    Применяет набор полей к сериализатору верхнего уровня.
+    collapsed_fields — поля, которые без expand выводятся идентификаторами.
+    """
+    collapsed_fields = {}
+
+    @property
+    def fieldset(self):
+        fieldset = self.context.get('fieldset')
+        is_top = self.root is self or (
+            self.root is self.parent
+            and isinstance(self.parent, serializers.ListSerializer))
+        if fieldset is None or not is_top:
+            return Fieldset()
+        return fieldset
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.fieldset
+        if fieldset.fields is None:
+            return fields
+        unknown = fieldset.fields - fields.keys()
+        if unknown:
+            raise serializers.ValidationError({
+                Fieldset.fields_param: 'Неизвестные поля: {}'.format(
+                    ', '.join(sorted(unknown))),
+            })
+        return {
+            name: field if name not in self.collapsed_fields
+            or fieldset.expands(name) else self.collapsed_fields[name]()
+            for name, field in fields.items()
+            if fieldset.includes(name)
+        }
@@ -1,5 +1,9 @@
+from django import forms
+from django.db.models import Exists, F, OuterRef
 from django_filters import rest_framework as filters
-from recipes.models import Ingredient, Recipe
+from recipes.models import Favorite, Ingredient, Recipe, RecipeTag, ShopingCart
+from recipes.search import search
+from rest_framework.filters import BaseFilterBackend
 
 
 class IngredientFilter(filters.FilterSet):
@@ -13,15 +17,31 @@ class IngredientFilter(filters.FilterSet):
         fields = ('name',)
 
 
+class MultipleValueField(forms.Field):
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        return [item for item in value or () if item]
+
+
+class MultipleValueFilter(filters.Filter):
+    """Список значений из повторяющегося параметра без запроса choices."""
+    field_class = MultipleValueField
+
+
 class RecipeFilter(filters.FilterSet):
     is_favorited = filters.BooleanFilter(
         method='get_favorite',
         label='favorite',
     )
-    tags = filters.AllValuesMultipleFilter(
-        field_name='tags__slug',
+    tags = MultipleValueFilter(
+        method='get_tags',
         label='tags',
     )
+    author = filters.NumberFilter(
+        field_name='author',
+        label='author',
+    )
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
         label='shopping_cart',
@@ -36,14 +56,54 @@ class RecipeFilter(filters.FilterSet):
             'is_in_shopping_cart',
         )
 
+    def filter_by_user(self, queryset, model, value):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        in_list = Exists(model.objects.filter(
+            user=user, recipe=OuterRef('pk')))
+        return queryset.filter(in_list if value else ~in_list)
+
     def get_favorite(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorites__user=self.request.user)
-        return queryset.exclude(
-            favorites__user=self.request.user
-        )
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        return Recipe.objects.filter(
-            cart__user=self.request.user
-        )
+        return self.filter_by_user(queryset, ShopingCart, value)
+
+    def get_tags(self, queryset, name, value):
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value)))
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск ?search=, самые релевантные рецепты первыми."""
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search(queryset, query).order_by('-search_rank', '-id')
+
+
+class RecipeOrderingFilter(BaseFilterBackend):
+    """
+    Сортировка рецептов: ?ordering=popular|newest|fastest.
+    Порядок задаётся строками полей, чтобы его могла
+    повторить курсорная пагинация.
+    """
+    ordering_param = 'ordering'
+    orderings = {
+        'newest': ('-id',),
+        'fastest': ('cooking_time', '-id'),
+        'popular': ('-popularity_score', '-id'),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.ordering_param)
+        if name not in self.orderings:
+            return queryset
+        if name == 'popular':
+            queryset = queryset.annotate(
+                popularity_score=F('popularity__score'))
+        return queryset.order_by(*self.orderings[name])
@@ -0,0 +1,96 @@
+from django.db.models import CharField, Value
+from recipes.models import Favorite, ShopingCart, Subscribe
+
+
+class UserFlags:
+    """
+    Избранное, корзина и подписки текущего пользователя в рамках запроса.
+    Идентификаторы рецептов и авторов страницы загружаются пачкой
+    через load(), после чего флаги отдаются из памяти.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.favorites = set()
+        self.cart = set()
+        self.subscriptions = set()
+        self.loaded_recipes = set()
+        self.loaded_authors = set()
+
+    @classmethod
+    def for_request(cls, request):
+        flags = getattr(request, '_user_flags', None)
+        if flags is None or flags.user != request.user:
+            flags = cls(request.user)
+            request._user_flags = flags
+        return flags
+
+    def queries(self, recipe_ids=None, author_ids=None):
+        """
+        Запросы флагов по идентификаторам; вместо списка можно передать
+        подзапрос, чтобы выполнить их параллельно с выборкой страницы.
+        """
+        if self.user.is_anonymous:
+            return {}
+        queries = {}
+        if recipe_ids is not None:
+            queries['favorites'] = Favorite.objects.filter(
+                user=self.user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)
+            queries['cart'] = ShopingCart.objects.filter(
+                user=self.user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True)
+        if author_ids is not None:
+            queries['subscriptions'] = Subscribe.objects.filter(
+                user=self.user, following_id__in=author_ids
+            ).values_list('following_id', flat=True)
+        return queries
+
+    def add(self, results, recipe_ids=(), author_ids=()):
+        for name, ids in results.items():
+            getattr(self, name).update(ids)
+        self.loaded_recipes.update(recipe_ids)
+        self.loaded_authors.update(author_ids)
+
+    def load(self, recipe_ids=(), author_ids=()):
+        if self.user.is_anonymous:
+            return
+        recipe_ids = set(recipe_ids) - self.loaded_recipes
+        author_ids = set(author_ids) - self.loaded_authors
+        queries = self.queries(recipe_ids or None, author_ids or None)
+        self.add(
+            {name: list(query) for name, query in queries.items()},
+            recipe_ids, author_ids,
+        )
+
+    def load_recipe(self, recipe_id, author_id):
+        """Флаги одного рецепта и его автора одним запросом вместо трёх."""
+        if self.user.is_anonymous:
+            return
+        first, *rest = (
+            query.values_list(Value(name, output_field=CharField()), field)
+            for name, query, field in (
+                ('favorites', Favorite.objects.filter(
+                    user=self.user, recipe_id=recipe_id), 'recipe_id'),
+                ('cart', ShopingCart.objects.filter(
+                    user=self.user, recipe_id=recipe_id), 'recipe_id'),
+                ('subscriptions', Subscribe.objects.filter(
+                    user=self.user, following_id=author_id), 'following_id'),
+            )
+        )
+        results = {'favorites': [], 'cart': [], 'subscriptions': []}
+        for name, value in first.union(*rest, all=True):
+            results[name].append(value)
+        self.add(results, (recipe_id,), (author_id,))
+
+    def is_favorited(self, recipe_id):
+        self.load(recipe_ids=(recipe_id,))
+        return recipe_id in self.favorites
+
+    def is_in_shopping_cart(self, recipe_id):
+        self.load(recipe_ids=(recipe_id,))
+        return recipe_id in self.cart
+
+    def is_subscribed(self, author_id):
+        self.load(author_ids=(author_id,))
+        return author_id in self.subscriptions
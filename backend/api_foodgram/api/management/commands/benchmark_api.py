@@ -0,0 +1,391 @@
+import base64
+import io
+import json
+import math
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from api.plain_serializers import (PlainRecipeSerializer,
+                                   PlainRecipeShortSerializer,
+                                   PlainSubscriptionsSerializer)
+from api.serializers import (RecipeSerializer, RecipeShortSerializer,
+                             SubscriptionsSerializer)
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Prefetch
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+from PIL import Image
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShopingCart, Subscribe, Tag)
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import User
+
+IMAGE_NAME = 'recipes/benchmark.png'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+def seed(options):
+    """Заполняет тестовую базу синтетическими данными."""
+    rnd = random.Random(options['seed'])
+    User.objects.bulk_create(
+        User(username=f'bench{i}', email=f'bench{i}@example.com')
+        for i in range(options['users'])
+    )
+    users = list(User.objects.order_by('id'))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', slug=f'tag{i}', color='#E26C2D')
+        for i in range(6)
+    )
+    tags = list(Tag.objects.order_by('id'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'ингредиент {i:06}', measurement_unit='г')
+        for i in range(options['ingredients'])
+    )
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=rnd.choice(users),
+            name=f'Рецепт {i}',
+            text='Описание рецепта. ' * 20,
+            cooking_time=rnd.randint(1, 180),
+            image=IMAGE_NAME,
+        )
+        for i in range(options['recipes'])
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    per_recipe = min(options['ingredients_per_recipe'], len(ingredient_ids))
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=rnd.randint(1, 500),
+        )
+        for recipe_id in recipe_ids
+        for ingredient_id in rnd.sample(ingredient_ids, per_recipe)
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe_id=recipe_id, tag=tag)
+        for recipe_id in recipe_ids
+        for tag in rnd.sample(tags, rnd.randint(1, 3))
+    )
+    for model, amount in ((Favorite, options['favorites']),
+                          (ShopingCart, options['cart'])):
+        model.objects.bulk_create(
+            model(user=user, recipe_id=recipe_id)
+            for user in users
+            for recipe_id in rnd.sample(
+                recipe_ids, min(amount, len(recipe_ids)))
+        )
+    Subscribe.objects.bulk_create(
+        Subscribe(user=user, following=following)
+        for user in users
+        for following in rnd.sample(
+            [other for other in users if other != user],
+            min(options['subscriptions'], len(users) - 1))
+    )
+    call_command('rebuild_counters', stdout=io.StringIO())
+    call_command('rebuild_popularity', stdout=io.StringIO())
+    call_command('rebuild_search_index', stdout=io.StringIO())
+    call_command('rebuild_shopping_lists', stdout=io.StringIO())
+    return users, tags, ingredient_ids
+
+
+def scenarios(users, tags, ingredient_ids):
+    """
+    Список замеряемых запросов:
+    (имя, пользователь, метод, путь, тело, подготовка).
+    Подготовка — запрос (метод, путь[, тело]), который выполняется перед
+    каждым замером изменяющего запроса и возвращает данные в исходное
+    состояние.
+    """
+    user, author = users[0], users[-1]
+    own_recipe = Recipe.objects.filter(author=user).first()
+    recipe = Recipe.objects.exclude(favorites__user=user).exclude(
+        cart__user=user).first()
+    following = User.objects.exclude(id=user.id).exclude(
+        following__user=user).first()
+    pages = max(Recipe.objects.count() // 6, 1)
+    payload = {
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': make_image(),
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in ingredient_ids[:5]
+        ],
+    }
+    result = [
+        ('recipes_list', user, 'get', '/api/recipes/', None, None),
+        ('recipes_list_anonymous', None, 'get', '/api/recipes/', None, None),
+        ('recipes_list_deep_page', user, 'get',
+         f'/api/recipes/?page={pages // 2 + 1}', None, None),
+        ('recipes_list_cursor', user, 'get',
+         '/api/recipes/?cursor=', None, None),
+        ('recipes_list_popular', user, 'get',
+         '/api/recipes/?ordering=popular', None, None),
+        ('recipes_list_popular_cursor', user, 'get',
+         '/api/recipes/?ordering=popular&cursor=', None, None),
+        ('recipes_search', user, 'get',
+         '/api/recipes/?search=ингредиент', None, None),
+        ('recipes_filter_tags', user, 'get',
+         f'/api/recipes/?tags={tags[0].slug}&tags={tags[1].slug}', None, None),
+        ('recipes_filter_author', user, 'get',
+         f'/api/recipes/?author={author.id}', None, None),
+        ('recipes_filter_favorited', user, 'get',
+         '/api/recipes/?is_favorited=1', None, None),
+        ('recipes_filter_shopping_cart', user, 'get',
+         '/api/recipes/?is_in_shopping_cart=1', None, None),
+        ('recipe_detail', user, 'get',
+         f'/api/recipes/{recipe.id}/', None, None),
+        ('recipe_create', user, 'post', '/api/recipes/', payload, None),
+        ('download_shopping_cart', user, 'get',
+         '/api/recipes/download_shopping_cart/', None, None),
+        ('download_shopping_cart_csv', user, 'get',
+         '/api/recipes/download_shopping_cart/?format=csv', None, None),
+        ('shopping_list', user, 'get',
+         '/api/recipes/shopping_list/', None, None),
+        ('subscriptions', user, 'get',
+         '/api/users/subscriptions/?recipes_limit=3', None, None),
+        ('ingredients_search', None, 'get',
+         '/api/ingredients/?name=ингредиент 0001', None, None),
+        ('ingredients_list', None, 'get', '/api/ingredients/', None, None),
+        ('tags_list', None, 'get', '/api/tags/', None, None),
+        ('users_list', user, 'get', '/api/users/', None, None),
+    ]
+    if own_recipe is not None:
+        result.append(('recipe_update', user, 'patch',
+                       f'/api/recipes/{own_recipe.id}/', payload, None))
+    for action in ('favorite', 'shopping_cart'):
+        path = f'/api/recipes/{recipe.id}/{action}/'
+        result.append(
+            (f'{action}_add', user, 'post', path, None, ('delete', path)))
+        result.append(
+            (f'{action}_remove', user, 'delete', path, None, ('post', path)))
+    for action, related in (('favorite', 'favorites'),
+                            ('shopping_cart', 'cart')):
+        path = f'/api/recipes/{action}/'
+        body = {'recipes': list(Recipe.objects.exclude(
+            **{f'{related}__user': user}).values_list('id', flat=True)[:20])}
+        result.append((f'{action}_bulk_add', user, 'post', path, body,
+                       ('delete', path, body)))
+        result.append((f'{action}_bulk_remove', user, 'delete', path, body,
+                       ('post', path, body)))
+    if following is not None:
+        path = f'/api/users/{following.id}/subscribe/'
+        result.append(
+            ('subscribe', user, 'post', path, None, ('delete', path)))
+        result.append(
+            ('unsubscribe', user, 'delete', path, None, ('post', path)))
+    return result
+
+
+def serializer_cases(user, items):
+    """
+    Сериализаторы чтения в двух вариантах:
+    (имя, вариант, queryset, класс, дополнительный контекст).
+    """
+    recipes = Recipe.objects.all()[:items]
+    full = Recipe.objects.select_related('author').prefetch_related(
+        'tags',
+        Prefetch('recipeingredient_set',
+                 queryset=RecipeIngredient.objects.select_related(
+                     'ingredient')),
+    )[:items]
+    authors = User.objects.order_by('id')[:items]
+    recent = {'recent_recipes': Recipe.objects.all()}
+    return (
+        ('recipe', 'drf', full, RecipeSerializer, {}),
+        ('recipe', 'plain',
+         recipes.values(*PlainRecipeSerializer.columns),
+         PlainRecipeSerializer, {}),
+        ('recipe_short', 'drf', recipes, RecipeShortSerializer, {}),
+        ('recipe_short', 'plain',
+         recipes.values(*PlainRecipeShortSerializer.columns),
+         PlainRecipeShortSerializer, {}),
+        ('subscriptions', 'drf', authors.prefetch_related(Prefetch(
+            'recipes', queryset=Recipe.objects.all(),
+            to_attr='recent_recipes')),
+         SubscriptionsSerializer, recent),
+        ('subscriptions', 'plain',
+         authors.values(*PlainSubscriptionsSerializer.columns),
+         PlainSubscriptionsSerializer, recent),
+    )
+
+
+def perform(client, method, path, data=None):
+    if method == 'get':
+        response = client.get(path)
+    else:
+        response = getattr(client, method)(path, data, format='json')
+    if response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    return response.status_code, size
+
+
+class Command(BaseCommand):
+    help = ('Замеряет число SQL-запросов, задержку и память '
+            'эндпоинтов API на синтетических данных')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20)
+        parser.add_argument('--cart', type=int, default=10)
+        parser.add_argument('--subscriptions', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--serializer-items', type=int, default=100,
+            help='Сколько объектов сериализовать при замере сериализаторов')
+        parser.add_argument(
+            '--output', help='Файл для JSON-отчёта, по умолчанию stdout')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять тестовую базу после замеров')
+
+    def measure(self, client, scenario, repeat):
+        method, path, data, before = scenario
+        if before is not None:
+            perform(client, *before)
+        tracemalloc.start()
+        perform(client, method, path, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        timings = []
+        for _ in range(repeat):
+            if before is not None:
+                perform(client, *before)
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                status, size = perform(client, method, path, data)
+                timings.append((time.perf_counter() - start) * 1000)
+        return {
+            'method': method.upper(),
+            'path': path,
+            'status': status,
+            'queries': len(queries.captured_queries),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'response_bytes': size,
+        }
+
+    def measure_serializer(self, user, queryset, serializer_class, context,
+                           repeat):
+        """
+        Время на объект от выборки строк до готовых данных ответа:
+        именно эту часть list выполняет сериализатор со своими запросами.
+        """
+        timings = []
+        for _ in range(repeat):
+            request = Request(APIRequestFactory().get('/api/'))
+            request.user = user
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                rows = list(queryset.all())
+                serializer_class(rows, many=True, context={
+                    'request': request, **context}).data
+                timings.append(time.perf_counter() - start)
+        items = max(len(rows), 1)
+        return {
+            'items': len(rows),
+            'queries': len(queries.captured_queries),
+            'p50_us_per_item': round(
+                percentile(timings, 0.5) / items * 1e6, 1),
+            'p95_us_per_item': round(
+                percentile(timings, 0.95) / items * 1e6, 1),
+        }
+
+    def run(self, options):
+        dataset = seed(options)
+        results = {}
+        for name, user, *scenario in scenarios(*dataset):
+            client = APIClient()
+            if user is not None:
+                client.force_authenticate(user)
+            results[name] = self.measure(
+                client, scenario, options['repeat'])
+            self.stderr.write(f'{name}: {results[name]["p50_ms"]} ms')
+        serializers = {}
+        user = dataset[0][0]
+        for name, variant, *case in serializer_cases(
+                user, options['serializer_items']):
+            serializers.setdefault(name, {})[variant] = (
+                self.measure_serializer(user, *case, options['repeat']))
+            self.stderr.write(
+                f'{name} ({variant}): '
+                f'{serializers[name][variant]["p50_us_per_item"]} us/item')
+        return results, serializers
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root, CACHES=CACHES):
+                    results, serializers = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = json.dumps({
+            'created': timezone.now().isoformat(),
+            'commit': self.get_commit(),
+            'database': connection.vendor,
+            'options': {
+                key: options[key] for key in (
+                    'users', 'recipes', 'ingredients',
+                    'ingredients_per_recipe', 'favorites', 'cart',
+                    'subscriptions', 'repeat', 'seed', 'serializer_items')
+            },
+            'results': results,
+            'serializers': serializers,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', 'HEAD'),
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
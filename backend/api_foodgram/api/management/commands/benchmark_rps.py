@@ -0,0 +1,108 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from .benchmark_api import percentile
+
+PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/tags/',
+    '/api/ingredients/?name=а',
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность запущенных серверов '
+            '(например, WSGI и ASGI) под параллельной нагрузкой')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='Сервер в виде имя=адрес, '
+                 'например asgi=http://localhost:8001')
+        parser.add_argument(
+            '--path', action='append',
+            help='Запрашиваемый путь, по умолчанию чтение рецептов, '
+                 'тегов и ингредиентов')
+        parser.add_argument('--token', help='Токен для авторизации')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument(
+            '--output', help='Файл для JSON-отчёта, по умолчанию stdout')
+
+    def load(self, base_url, paths, headers, concurrency, duration):
+        """Гоняет запросы по кругу concurrency потоками duration секунд."""
+        deadline = time.perf_counter() + duration
+
+        def worker(number):
+            session = requests.Session()
+            session.headers.update(headers)
+            timings, errors = [], 0
+            index = number
+            while time.perf_counter() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    response = session.get(base_url + path)
+                    response.raise_for_status()
+                except requests.RequestException:
+                    errors += 1
+                    continue
+                timings.append((time.perf_counter() - start) * 1000)
+            return timings, errors
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(worker, range(concurrency)))
+        timings = [value for result in results for value in result[0]]
+        errors = sum(result[1] for result in results)
+        return timings, errors
+
+    def handle(self, *args, **options):
+        paths = options['path'] or PATHS
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        results = {}
+        for target in options['target']:
+            name, sep, base_url = target.partition('=')
+            if not sep:
+                raise CommandError(f'Ожидалось имя=адрес, получено {target}')
+            base_url = base_url.rstrip('/')
+            self.load(base_url, paths, headers,
+                      options['concurrency'], options['warmup'])
+            timings, errors = self.load(
+                base_url, paths, headers,
+                options['concurrency'], options['duration'])
+            results[name] = {
+                'url': base_url,
+                'requests': len(timings),
+                'errors': errors,
+                'rps': round(len(timings) / options['duration'], 1),
+                'p50_ms': round(percentile(timings, 0.5), 3)
+                if timings else None,
+                'p95_ms': round(percentile(timings, 0.95), 3)
+                if timings else None,
+            }
+            self.stderr.write(f'{name}: {results[name]["rps"]} rps')
+
+        report = json.dumps({
+            'created': timezone.now().isoformat(),
+            'options': {
+                key: options[key]
+                for key in ('concurrency', 'duration', 'warmup')
+            },
+            'paths': list(paths),
+            'results': results,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,191 @@
+"""
+Замеры запросов к API: время, SQL, сериализация, размер ответа.
+Гистограммы хранятся в памяти процесса и отдаются в текстовом формате
+Prometheus; у каждого воркера gunicorn они свои (метка pid).
+"""
+import contextlib
+import contextvars
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from django.db import connections
+from rest_framework import serializers
+
+from .db import connection_metrics
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+IN_LIST = re.compile(r'%s(?:, %s)+')
+
+
+class RequestProfile:
+    """Собирает SQL и время сериализации одного запроса из всех потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.queries += 1
+                self.sql_time += duration
+                self.shapes[IN_LIST.sub('%s', sql)] += 1
+
+    @contextlib.contextmanager
+    def serializing(self):
+        with self.lock:
+            self.serializer_depth += 1
+            outermost = self.serializer_depth == 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.serializer_depth -= 1
+                if outermost:
+                    self.serializer_time += time.perf_counter() - start
+
+    def repeated_queries(self, threshold):
+        return [
+            (sql, times) for sql, times in self.shapes.most_common()
+            if times >= threshold
+        ]
+
+
+@contextlib.contextmanager
+def profile_queries():
+    """Подключает текущий профиль к соединениям этого потока."""
+    profile = current_profile.get()
+    with contextlib.ExitStack() as stack:
+        if profile is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+        yield
+
+
+def instrument_serializers():
+    """Считает время BaseSerializer.data верхнего уровня."""
+    data = serializers.BaseSerializer.data
+
+    def profiled_data(self):
+        profile = current_profile.get()
+        if profile is None:
+            return data.fget(self)
+        with profile.serializing():
+            return data.fget(self)
+
+    serializers.BaseSerializer.data = property(profiled_data)
+
+
+def format_labels(labels):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('"', '\\"'))
+        for name, value in labels
+    )
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels, value):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.series.get(
+                key, ([0] * len(self.buckets), 0.0, 0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self.series[key] = (counts, total + value, count + 1)
+
+    def collect(self, extra_labels=()):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted(
+                (key, (list(counts), total, count))
+                for key, (counts, total, count) in self.series.items()
+            )
+        for key, (counts, total, count) in series:
+            labels = key + tuple(extra_labels)
+            for bound, value in zip(self.buckets, counts):
+                bucket = format_labels(labels + (('le', bound),))
+                lines.append(f'{self.name}_bucket{{{bucket}}} {value}')
+            bucket = format_labels(labels + (('le', '+Inf'),))
+            lines.append(f'{self.name}_bucket{{{bucket}}} {count}')
+            lines.append(f'{self.name}_sum{{{format_labels(labels)}}} {total}')
+            lines.append(
+                f'{self.name}_count{{{format_labels(labels)}}} {count}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки запроса', DURATION_BUCKETS)
+SQL_QUERIES = Histogram(
+    'foodgram_request_sql_queries',
+    'Число SQL-запросов на запрос к API', COUNT_BUCKETS)
+SQL_DURATION = Histogram(
+    'foodgram_request_sql_duration_seconds',
+    'Суммарное время SQL-запросов', DURATION_BUCKETS)
+SERIALIZER_DURATION = Histogram(
+    'foodgram_request_serializer_duration_seconds',
+    'Время сериализации ответа', DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'foodgram_response_size_bytes',
+    'Размер тела ответа', SIZE_BUCKETS)
+HISTOGRAMS = (
+    REQUEST_DURATION, SQL_QUERIES, SQL_DURATION,
+    SERIALIZER_DURATION, RESPONSE_SIZE,
+)
+
+
+def observe(labels, duration, profile, size):
+    REQUEST_DURATION.observe(labels, duration)
+    SQL_QUERIES.observe(labels, profile.queries)
+    SQL_DURATION.observe(labels, profile.sql_time)
+    SERIALIZER_DURATION.observe(labels, profile.serializer_time)
+    if size is not None:
+        RESPONSE_SIZE.observe(labels, size)
+
+
+def render_metrics():
+    process = (('pid', os.getpid()),)
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.collect(process))
+    database = connection_metrics()
+    for name in ('connects', 'health_check_failures'):
+        metric = f'foodgram_db_{name}_total'
+        lines.append(f'# TYPE {metric} counter')
+        for alias, stats in database.items():
+            labels = format_labels((('alias', alias),) + process)
+            lines.append(f'{metric}{{{labels}}} {stats[name]}')
+    for alias, stats in database.items():
+        for name, value in (stats.get('pool') or {}).items():
+            labels = format_labels((('alias', alias),) + process)
+            lines.append(f'foodgram_db_pool_{name}{{{labels}}} {value}')
+    return '\n'.join(lines) + '\n'
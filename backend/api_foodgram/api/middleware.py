@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence, compress_string
+
+from .metrics import RequestProfile, current_profile, observe, profile_queries
+
+try:
+    import brotli
+except ImportError:  # без пакета Brotli ответы сжимаются только gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Качество brotli для динамических ответов: заметно быстрее максимального
+# 11 при почти том же размере.
+BROTLI_QUALITY = 5
+
+
+class PerformanceMiddleware:
+    """
+    Включается PERF_INSTRUMENTATION=1. Для каждого представления DRF
+    пишет гистограммы (см. /api/metrics/), отдаёт заголовок Server-Timing
+    и предупреждает в лог о повторяющихся одинаковых SQL-запросах (N+1).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with profile_queries():
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        duration = time.perf_counter() - start
+        labels = getattr(request, '_perf_labels', None)
+        if labels is None:
+            return response
+        size = None if response.streaming else len(response.content)
+        observe(labels, duration, profile, size)
+        response['Server-Timing'] = ', '.join((
+            f'total;dur={duration * 1000:.1f}',
+            f'sql;dur={profile.sql_time * 1000:.1f};'
+            f'desc="{profile.queries} queries"',
+            f'serializer;dur={profile.serializer_time * 1000:.1f}',
+        ))
+        for sql, times in profile.repeated_queries(
+                settings.PERF_N_PLUS_ONE_THRESHOLD):
+            logger.warning(
+                'Возможный N+1 в %s.%s: %s раз %s',
+                labels['view'], labels['action'], times, sql)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', None)
+        if view is None:
+            return None
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None) or {}
+        request._perf_labels = {
+            'view': view.__name__,
+            'action': actions.get(method, method),
+            'method': request.method,
+        }
+        return None
+
+
+def parse_accept_encoding(header):
+    """Кодировки из Accept-Encoding с их весами q."""
+    weights = {}
+    for item in header.split(','):
+        coding, *params = item.strip().lower().split(';')
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding] = weight
+    return weights
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Сжимает ответы brotli или gzip — что клиент предпочитает
+    в Accept-Encoding; при равных весах brotli. Включено по умолчанию,
+    выключается RESPONSE_COMPRESSION=0 (например, если сжимает nginx).
+    Под ASGI работает асинхронно, чтобы не переводить цепочку
+    middleware в один общий поток.
+    """
+    sync_capable = True
+    async_capable = True
+    min_length = 200
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        if asyncio.iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(
+            request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if (response.has_header('Content-Encoding')
+                or not response.streaming
+                and len(response.content) < self.min_length):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+        if response.streaming:
+            response.streaming_content = self.compress_sequence(
+                encoding, response.streaming_content)
+            del response['Content-Length']
+        else:
+            content = self.compress(encoding, response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response['Content-Length'] = str(len(content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    def choose_encoding(self, header):
+        weights = parse_accept_encoding(header)
+        default = weights.get('*', 0.0)
+        best, best_weight = None, 0.0
+        for encoding in self.encodings:
+            weight = weights.get(encoding, default)
+            if weight > best_weight:
+                best, best_weight = encoding, weight
+        return best
+
+    def compress(self, encoding, content):
+        if encoding == 'br':
+            return brotli.compress(content, quality=BROTLI_QUALITY)
+        return compress_string(content)
+
+    def compress_sequence(self, encoding, sequence):
+        if encoding == 'br':
+            return brotli_sequence(sequence)
+        return compress_sequence(sequence)
@@ -1,7 +1,141 @@
+import json
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (CursorPagination, LimitOffsetPagination,
+                                       PageNumberPagination)
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк по плану запроса PostgreSQL вместо COUNT(*).
+    На остальных СУБД возвращает точное количество.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimate_count(self.object_list)
+
+
+class OptionalCursorPaginationMixin:
+    """
+    Включает курсорную пагинацию, если в запросе передан ?cursor=
+    (для первой страницы значение можно оставить пустым; курсор идёт
+    в порядке сортировки queryset, если он задан явно),
+    и приблизительный подсчёт количества при ?count=approximate.
+    """
+    cursor_query_param = 'cursor'
+    cursor_ordering = '-id'
+    count_query_param = 'count'
+    approximate_count = 'approximate'
+    cursor_paginator = None
+
+    def get_cursor_paginator(self, queryset):
+        paginator = CursorPagination()
+        paginator.page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        paginator.page_size_query_param = 'limit'
+        paginator.cursor_query_param = self.cursor_query_param
+        paginator.ordering = (
+            tuple(queryset.query.order_by) or self.cursor_ordering)
+        return paginator
+
+    def is_count_approximate(self, request):
+        return (request.query_params.get(self.count_query_param)
+                == self.approximate_count)
+
+    def count_queryset(self, queryset):
+        if self.is_count_approximate(self.request):
+            return estimate_count(queryset)
+        return queryset.count()
+
+    def get_page_window(self, request):
+        """
+        Смещение и размер страницы, если их можно узнать без подсчёта
+        строк: тогда строки и количество выбираются параллельно
+        (см. api.async_views), а пагинация, вернувшая окно, получает их
+        в set_page(queryset, rows, count). Иначе None.
+        """
+        return None
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.cursor_paginator = None
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.get_cursor_paginator(queryset)
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
 
-class CustomPageNumberPagination(PageNumberPagination):
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class CustomPageNumberPagination(OptionalCursorPaginationMixin,
+                                 PageNumberPagination):
     page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
     page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = (
+            EstimatedCountPaginator if self.is_count_approximate(request)
+            else Paginator
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_page_window(self, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        number = request.query_params.get(self.page_query_param, '1')
+        if (self.cursor_query_param in request.query_params
+                or not page_size or not number.isdigit() or number == '0'):
+            return None
+        self.page_number = int(number)
+        self.page_size = page_size
+        return (self.page_number - 1) * page_size, page_size
+
+    def set_page(self, queryset, rows, count):
+        paginator = Paginator(queryset, self.page_size)
+        paginator.count = count
+        try:
+            paginator.validate_number(self.page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=self.page_number, message=str(exc)))
+        self.page = Page(rows, self.page_number, paginator)
+
+
+class SubscriptionsPagination(OptionalCursorPaginationMixin,
+                              LimitOffsetPagination):
+    cursor_ordering = 'id'
+
+    def get_count(self, queryset):
+        return self.count_queryset(queryset)
+
+    def get_page_window(self, request):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if (self.cursor_query_param in request.query_params
+                or self.limit is None):
+            return None
+        self.offset = self.get_offset(request)
+        return self.offset, self.limit
+
+    def set_page(self, queryset, rows, count):
+        self.count = count
@@ -3,5 +3,5 @@ from rest_framework import permissions
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return (obj.author == request.user
-                or request.method in permissions.SAFE_METHODS)
+        return (request.method in permissions.SAFE_METHODS
+                or obj.author == request.user)
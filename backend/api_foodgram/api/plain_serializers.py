@@ -0,0 +1,196 @@
+"""
+Сериализаторы только для чтения, которые строят ответ из строк .values()
+в обход полей DRF: на страницах рецептов и подписок разбор полей
+ModelSerializer стоит больше, чем сами запросы. Вывод совпадает
+с RecipeSerializer, RecipeShortSerializer и SubscriptionsSerializer.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from rest_framework import serializers
+
+from .fields import file_url, rendition_urls
+from .serializers import UserFlagsMixin
+
+IMAGE_STORAGE = Recipe._meta.get_field('image').storage
+
+
+class PlainListSerializer(serializers.ListSerializer):
+    """Загружает связанные данные сразу для всех строк страницы."""
+
+    def to_representation(self, data):
+        rows = list(data)
+        self.child.load(rows)
+        return [self.child.to_representation(row) for row in rows]
+
+
+class PlainSerializer(serializers.BaseSerializer):
+    """
+    Принимает словари из queryset.values(*columns).
+    load() выбирает связанные данные для строк пачкой.
+    """
+    columns = ()
+
+    class Meta:
+        list_serializer_class = PlainListSerializer
+
+    @property
+    def data(self):
+        if not hasattr(self, '_data') and self.instance is not None:
+            self.load([self.instance])
+        return super().data
+
+    def load(self, rows):
+        pass
+
+    @property
+    def request(self):
+        return self.context.get('request')
+
+
+class PlainRecipeShortSerializer(PlainSerializer):
+    columns = ('id', 'name', 'image', 'renditions', 'cooking_time')
+
+    def image(self, row):
+        if not row['image']:
+            return None
+        return file_url(IMAGE_STORAGE, row['image'], self.request)
+
+    def images(self, row):
+        return rendition_urls(
+            IMAGE_STORAGE, row['image'], row['renditions'], self.request)
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'image': self.image(row),
+            'images': self.images(row),
+            'cooking_time': row['cooking_time'],
+        }
+
+
+class PlainRecipeSerializer(UserFlagsMixin, PlainRecipeShortSerializer):
+    columns = (
+        'id', 'author_id', 'author__username', 'author__email',
+        'author__first_name', 'author__last_name',
+        'name', 'text', 'cooking_time', 'image', 'renditions',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tags = defaultdict(list)
+        self.ingredients = defaultdict(list)
+
+    def load(self, rows):
+        recipe_ids = [row['id'] for row in rows]
+        self.user_flags.load(
+            recipe_ids=recipe_ids,
+            author_ids=[row['author_id'] for row in rows],
+        )
+        # Порядок тот же, что у prefetch_related в RecipeViewSet.
+        tags = RecipeTag.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('tag__name').values_list(
+            'recipe_id', 'tag_id', 'tag__name', 'tag__slug', 'tag__color')
+        for recipe_id, tag_id, name, slug, color in tags:
+            self.tags[recipe_id].append(
+                {'id': tag_id, 'name': name, 'slug': slug, 'color': color})
+        ingredients = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount')
+        for recipe_id, ingredient_id, name, unit, amount in ingredients:
+            self.ingredients[recipe_id].append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': unit,
+                'amount': amount,
+            })
+
+    def to_representation(self, row):
+        flags = self.user_flags
+        return {
+            'id': row['id'],
+            'author': {
+                'id': row['author_id'],
+                'username': row['author__username'],
+                'email': row['author__email'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'is_subscribed': flags.is_subscribed(row['author_id']),
+            },
+            'name': row['name'],
+            'text': row['text'],
+            'ingredients': self.ingredients[row['id']],
+            'tags': self.tags[row['id']],
+            'cooking_time': row['cooking_time'],
+            'is_favorited': flags.is_favorited(row['id']),
+            'is_in_shopping_cart': flags.is_in_shopping_cart(row['id']),
+            'image': self.image(row),
+            'images': self.images(row),
+        }
+
+
+class PlainSubscriptionsSerializer(PlainSerializer):
+    """
+    Рецепты авторов выбираются из context['recent_recipes'] —
+    queryset рецептов с учётом recipes_limit.
+    """
+    columns = (
+        'email', 'id', 'username', 'first_name', 'last_name',
+        'recipes_count',
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recipes = defaultdict(list)
+        self.recipe_serializer = PlainRecipeShortSerializer(
+            context=self.context)
+
+    def load(self, rows):
+        recipes = self.context['recent_recipes'].filter(
+            author_id__in=[row['id'] for row in rows]
+        ).values('author_id', *PlainRecipeShortSerializer.columns)
+        for recipe in recipes:
+            self.recipes[recipe['author_id']].append(
+                self.recipe_serializer.to_representation(recipe))
+
+    def to_representation(self, row):
+        return {
+            'email': row['email'],
+            'id': row['id'],
+            'username': row['username'],
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'is_subscribed': True,
+            'recipes': self.recipes[row['id']],
+            'recipes_count': row['recipes_count'],
+        }
+
+
+class PlainReadMixin:
+    """
+    list и retrieve без ?fields= отдаются plain_serializer_class,
+    а get_queryset в этом случае возвращает строки .values().
+    Выключается PLAIN_READ_SERIALIZERS=0.
+    """
+    plain_actions = ('list', 'retrieve')
+    plain_serializer_class = None
+
+    @property
+    def plain_read(self):
+        return (settings.PLAIN_READ_SERIALIZERS
+                and self.request.method == 'GET'
+                and self.action in self.plain_actions
+                and self.fieldset.fields is None)
+
+    def get_plain_queryset(self, queryset):
+        return queryset.values(*self.plain_serializer_class.columns)
+
+    def get_serializer_class(self):
+        if self.plain_read:
+            return self.plain_serializer_class
+        return super().get_serializer_class()
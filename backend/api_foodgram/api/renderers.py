@@ -0,0 +1,79 @@
+import csv
+import json
+
+import orjson
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ShoppingListTextRenderer(renderers.BaseRenderer):
+    """
+    Список покупок в виде текста.
+    Сам список отдаётся потоком через stream(), render() нужен
+    только для ответов с ошибками.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+    def stream(self, rows):
+        yield 'Список покупок с сайта Foodgram:\n\n'
+        for name, measurement_unit, amount in rows:
+            yield f'{name}, {amount} {measurement_unit}\n'
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(('name', 'measurement_unit', 'amount'))
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class ShoppingListJSONRenderer(renderers.JSONRenderer):
+    def stream(self, rows):
+        yield '['
+        for index, (name, measurement_unit, amount) in enumerate(rows):
+            item = json.dumps({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            }, ensure_ascii=False)
+            yield item if index == 0 else ',' + item
+        yield ']'
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer на orjson: тот же компактный UTF-8 вывод, но быстрее.
+    Типы, которых orjson не знает (ленивые строки, Decimal),
+    передаются стандартному кодировщику DRF.
+    """
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        # Даты кодирует DRF, чтобы формат совпадал с JSONRenderer.
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type, renderer_context):
+            option |= orjson.OPT_INDENT_2
+        ret = orjson.dumps(data, default=self.encoder.default, option=option)
+        # Как и JSONRenderer, экранируем разделители строк для JavaScript.
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028'
+        ).replace('\u2029'.encode(), b'\\u2029')
@@ -1,11 +1,36 @@
+from django.conf import settings
 from django.core import validators
-from django.shortcuts import get_object_or_404
+from django.db import models, transaction
 from djoser.serializers import UserCreateSerializer
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Subscribe, Tag
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingListItem, Tag)
+from recipes.shopping_list import refresh_recipe
 from rest_framework import serializers
 from users.models import User
 
-from .fields import Base64ImageField
+from .fields import Base64ImageField, ImageRenditionsField
+from .fieldsets import SparseFieldsMixin
+from .loaders import UserFlags
+
+
+class UserFlagsListSerializer(serializers.ListSerializer):
+    """
+    Перед выводом списка загружает флаги пользователя
+    сразу для всех его элементов через child.load_user_flags().
+    """
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        data = list(data)
+        self.child.load_user_flags(data)
+        return super().to_representation(data)
+
+
+class UserFlagsMixin:
+    @property
+    def user_flags(self):
+        return UserFlags.for_request(self.context['request'])
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -19,7 +44,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class CustomUserSerializer(UserFlagsMixin, serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta():
@@ -29,13 +54,13 @@ class CustomUserSerializer(serializers.ModelSerializer):
             'first_name', 'last_name', 'is_subscribed'
         )
         read_only_fields = ('id', 'is_subscribed')
+        list_serializer_class = UserFlagsListSerializer
+
+    def load_user_flags(self, instances):
+        self.user_flags.load(author_ids=(user.id for user in instances))
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(
-            user=user, following=obj).exists()
+        return self.user_flags.is_subscribed(obj.id)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -73,13 +98,39 @@ class RecipeGetIngredientsSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeIngredientAmountSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient_id')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+
+
+class ShoppingListItemSerializer(RecipeGetIngredientsSerializer):
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class RecipeSerializer(SparseFieldsMixin, UserFlagsMixin,
+                       serializers.ModelSerializer):
+    collapsed_fields = {
+        'author': lambda: serializers.PrimaryKeyRelatedField(
+            read_only=True),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True),
+        'ingredients': lambda: RecipeIngredientAmountSerializer(
+            source='recipeingredient_set', many=True, read_only=True),
+    }
+
     class Meta:
         model = Recipe
         fields = ('id', 'author', 'name', 'text', 'ingredients', 'tags',
                   'cooking_time', 'is_favorited', 'is_in_shopping_cart',
-                  'image')
+                  'image', 'images')
         read_only_fields = ('id', 'author',)
+        list_serializer_class = UserFlagsListSerializer
 
     author = CustomUserSerializer(
         read_only=True,
@@ -99,20 +150,25 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     tags = TagSerializer(many=True, read_only=True)
     image = Base64ImageField(required=True)
+    images = ImageRenditionsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
+    def load_user_flags(self, instances):
+        fieldset = self.fieldset
+        self.user_flags.load(
+            recipe_ids=[recipe.id for recipe in instances]
+            if fieldset.includes('is_favorited')
+            or fieldset.includes('is_in_shopping_cart') else (),
+            author_ids=[recipe.author_id for recipe in instances]
+            if fieldset.expands('author') else (),
+        )
+
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return obj.favorites.filter(user=user).exists()
+        return self.user_flags.is_favorited(obj.id)
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return obj.cart.filter(user=user).exists()
+        return self.user_flags.is_in_shopping_cart(obj.id)
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -136,18 +192,27 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     image = Base64ImageField(required=True)
 
     def validate_ingredients(self, data):
-        try:
-            ingredients = {
-                get_object_or_404(
-                    Ingredient, id=item.get('ingredient').get('id')):
-                item.get('amount') for item in data}
-        except Exception:
-            raise serializers.ValidationError(
-                'Такого ингредиента нет в базе')
-        if len(data) != len(ingredients):
+        amounts = {
+            item['ingredient']['id']: item['amount'] for item in data}
+        if len(data) != len(amounts):
             raise serializers.ValidationError(
                 'Один или несколько ингредиентов повторяются')
-        return ingredients
+        found = Ingredient.objects.in_bulk(amounts)
+        if len(found) != len(amounts):
+            raise serializers.ValidationError(
+                'Такого ингредиента нет в базе')
+        return {
+            found[ingredient_id]: amount
+            for ingredient_id, amount in amounts.items()
+        }
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
 
     @staticmethod
     def bulk_create(recipe, ingredients):
@@ -160,6 +225,42 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
         RecipeIngredient.objects.bulk_create(bulk_create_data)
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Меняет только те строки, которые отличаются от текущих."""
+        amounts = {
+            ingredient.id: amount
+            for ingredient, amount in ingredients.items()
+        }
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipeingredient_set.all()
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        added = amounts.keys() - current.keys()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id in added
+        )
+        refresh_recipe(recipe.id, list(
+            removed | added | {item.ingredient_id for item in changed}))
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('recipeingredient_set')
         tags = validated_data.pop('tags')
@@ -168,18 +269,20 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         self.bulk_create(recipe, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('recipeingredient_set')
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(
-            recipe__id=instance.id).delete()
-        self.bulk_create(instance, ingredients)
+        ingredients = validated_data.pop('recipeingredient_set', None)
+        tags = validated_data.pop('tags', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
 
         return super().update(instance, validated_data)
 
 
-class SubscribeAuthorSerializer(serializers.ModelSerializer):
+class SubscribeAuthorSerializer(UserFlagsMixin,
+                                serializers.ModelSerializer):
     email = serializers.ReadOnlyField()
     username = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
@@ -192,40 +295,53 @@ class SubscribeAuthorSerializer(serializers.ModelSerializer):
                   'username', 'first_name',
                   'last_name', 'is_subscribed',
                   'recipes', 'recipes_amount')
+        list_serializer_class = UserFlagsListSerializer
+
+    def load_user_flags(self, instances):
+        self.user_flags.load(author_ids=(user.id for user in instances))
 
     def validate(self, attrs):
-        if self.context['request'].method == 'POST':
-            if Subscribe.objects.filter(
-                user=self.context.get('user'),
-                following=self.context.get('following')
-            ).exists():
-                raise serializers.ValidationError(
-                    'Вы уже подписаны на этого автора.')
+        # Повторную подписку отсекает уникальное ограничение при записи.
         if (self.context.get('user') == self.context.get('following')):
             raise serializers.ValidationError(
                 {'errors': 'Нельзя подписаться на себя.'})
         return attrs
 
     def get_is_subscribed(self, obj):
-        return (
-            self.context.get('request').user.is_authenticated
-            and Subscribe.objects.filter(user=self.context.get('request').user,
-                                         following=obj).exists())
+        return self.user_flags.is_subscribed(obj.id)
 
     def get_recipes_amount(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
 
 
 class RecipeShortSerializer(serializers.ModelSerializer):
+    images = ImageRenditionsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
-class SubscriptionsSerializer(serializers.ModelSerializer):
+class SubscriptionsSerializer(SparseFieldsMixin,
+                              serializers.ModelSerializer):
     """
     Сериализатор для подписок.
     """
+    collapsed_fields = {
+        'recipes': lambda: serializers.SerializerMethodField(
+            method_name='get_recipe_ids'),
+    }
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     recipes = serializers.SerializerMethodField(read_only=True)
     recipes_count = serializers.SerializerMethodField(read_only=True)
@@ -244,22 +360,15 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if not user:
-            return False
-        return Subscribe.objects.filter(user=user, following=obj).exists()
+        return True
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit_recipes = request.query_params.get('recipes_limit')
-        if limit_recipes is not None:
-            recipes = obj.recipes.all()[:(int(limit_recipes))]
-        else:
-            recipes = obj.recipes.all()
-        context = {'request': request}
-        return RecipeShortSerializer(recipes, many=True,
-                                     context=context).data
+        return RecipeShortSerializer(
+            obj.recent_recipes, many=True, context=self.context).data
+
+    def get_recipe_ids(self, obj):
+        return [recipe.id for recipe in obj.recent_recipes]
 
     @staticmethod
     def get_recipes_count(obj):
-        return obj.recipes.count()
+        return obj.recipes_count
@@ -0,0 +1,128 @@
+from api_foodgram.cache_versions import (bump_object_versions_on_commit,
+                                         bump_version_on_commit)
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from users.models import User
+
+from .db import check_connections, count, mark_connections_used
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version_on_commit('tags')
+    bump_version_on_commit('recipes')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version_on_commit('ingredients')
+    bump_version_on_commit('recipes')
+
+
+# Строки состава удаляются только при изменении самого рецепта,
+# поэтому post_delete для них не нужен и не мешает быстрому удалению.
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(m2m_changed, sender=RecipeTag)
+def recipes_changed(sender, **kwargs):
+    bump_version_on_commit('recipes')
+
+
+# Версии отдельных рецептов для кеша карточек (DetailCacheMixin).
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_detail_changed(sender, instance, **kwargs):
+    bump_object_versions_on_commit('recipes', (instance.pk,))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+def recipe_rows_changed(sender, instance, **kwargs):
+    bump_object_versions_on_commit('recipes', (instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=RecipeTag)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            bump_object_versions_on_commit('recipes', (instance.pk,))
+    elif action in ('post_add', 'post_remove'):
+        bump_object_versions_on_commit('recipes', pk_set)
+    elif action == 'pre_clear':
+        bump_object_versions_on_commit(
+            'recipes', instance.on_recipes.values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_recipes_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        bump_object_versions_on_commit(
+            'recipes', instance.on_recipes.values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_recipes_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        bump_object_versions_on_commit(
+            'recipes', RecipeIngredient.objects.filter(
+                ingredient=instance).values_list('recipe_id', flat=True))
+
+
+# Поля пользователя, которые выводятся в рецептах как автор.
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def author_fields(user):
+    # Через __dict__, чтобы не загружать отложенные поля.
+    return {name: user.__dict__.get(name) for name in AUTHOR_FIELDS}
+
+
+@receiver(post_init, sender=User)
+def author_loaded(sender, instance, **kwargs):
+    instance._author_fields = author_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Сбрасывает кеш рецептов автора, только если изменились выводимые
+    в них поля: вход в систему и смена пароля рецептов не касаются.
+    """
+    before, after = instance._author_fields, author_fields(instance)
+    instance._author_fields = after
+    names = AUTHOR_FIELDS if update_fields is None else update_fields
+    if created or all(
+            before.get(name) == after.get(name)
+            for name in names if name in after):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        bump_version_on_commit('recipes')
+        bump_object_versions_on_commit('recipes', recipe_ids)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    count(connection.alias, 'connects')
+
+
+@receiver(request_started)
+def request_started_check_connections(sender, **kwargs):
+    check_connections()
+
+
+@receiver(request_finished)
+def request_finished_mark_connections(sender, **kwargs):
+    mark_connections_used()
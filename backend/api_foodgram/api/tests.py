@@ -0,0 +1,1349 @@
+import gzip
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Barrier
+from unittest import mock
+
+import brotli
+from api.autocomplete import IngredientIndex
+from api.db import ReplicaRouter, primary_reads, replica_reads
+from api.renderers import ORJSONRenderer
+from api.views import RecipeViewSet
+from api_foodgram.cache_versions import bump_version_on_commit, get_version
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from recipes.models import (NO_POPULARITY, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, RecipePopularity, ShopingCart,
+                            ShoppingListItem, Subscribe, Tag)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+from users.models import User
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0, RECIPE_DETAIL_CACHE_TTL=0)
+class QueryCountTests(TestCase):
+    """Число запросов к базе не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass')
+            for i in range(6)
+        ]
+        cls.tags = [
+            Tag.objects.create(name=f'tag{i}', slug=f'tag{i}', color='#fff')
+            for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ingredient{i}',
+                                      measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.recipes = []
+        for i, author in enumerate(cls.authors * 2):
+            recipe = Recipe.objects.create(
+                author=author, name=f'recipe{i}', text='text',
+                cooking_time=i + 1)
+            recipe.tags.set(cls.tags)
+            for ingredient in cls.ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1)
+            cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+            ShopingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.authors:
+            Subscribe.objects.create(user=cls.user, following=author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_constant(self, num, url, sizes=(1, 6)):
+        for plain in (True, False):
+            for size in sizes:
+                with self.subTest(plain=plain, size=size), \
+                        self.settings(PLAIN_READ_SERIALIZERS=plain), \
+                        self.assertNumQueries(num):
+                    response = self.client.get(url.format(size=size))
+                    self.assertEqual(response.status_code, 200)
+
+    def test_recipe_list(self):
+        self.assert_constant(7, '/api/recipes/?limit={size}')
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_constant(4, '/api/recipes/?limit={size}')
+
+    def test_recipe_detail(self):
+        self.assert_constant(6, f'/api/recipes/{self.recipes[0].id}/',
+                             sizes=(1,))
+
+    def test_subscriptions(self):
+        self.assert_constant(
+            3, '/api/users/subscriptions/?limit={size}&recipes_limit=2')
+
+
+class ConcurrentWriteTests(TransactionTestCase):
+    """
+    Параллельные повторы одного запроса (двойной клик) не дают ошибок 500
+    и добавляют строку и счётчик ровно один раз.
+    """
+    threads = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('SQLite в памяти не пускает параллельные записи; '
+                          'задайте файл тестовой базы в DB_TEST_NAME.')
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=1)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, amount=1,
+            ingredient=Ingredient.objects.create(
+                name='ingredient', measurement_unit='г'))
+
+    def request(self, barrier, method, url):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        try:
+            barrier.wait()
+            return getattr(client, method)(url).status_code
+        finally:
+            connections.close_all()
+
+    def run_parallel(self, method, url):
+        barrier = Barrier(self.threads)
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [
+                executor.submit(self.request, barrier, method, url)
+                for _ in range(self.threads)
+            ]
+            return sorted(future.result() for future in futures)
+
+    def assert_once(self, url, absent_status, rows, counter):
+        codes = self.run_parallel('post', url)
+        self.assertEqual(codes, [201] + [400] * (self.threads - 1))
+        self.assertEqual(rows.count(), 1)
+        self.assertEqual(counter(), 1)
+        codes = self.run_parallel('delete', url)
+        self.assertEqual(
+            codes, [204] + [absent_status] * (self.threads - 1))
+        self.assertEqual(rows.count(), 0)
+        self.assertEqual(counter(), 0)
+
+    def recipe_counter(self, field):
+        return lambda: Recipe.objects.values_list(
+            field, flat=True).get(pk=self.recipe.pk)
+
+    def test_favorite(self):
+        self.assert_once(
+            f'/api/recipes/{self.recipe.pk}/favorite/', 404,
+            Favorite.objects.filter(user=self.user),
+            self.recipe_counter('favorites_count'))
+
+    def test_shopping_cart(self):
+        self.assert_once(
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/', 404,
+            ShopingCart.objects.filter(user=self.user),
+            lambda: sum(ShoppingListItem.objects.filter(
+                user=self.user).values_list('amount', flat=True)))
+
+    def test_subscribe(self):
+        self.assert_once(
+            f'/api/users/{self.author.pk}/subscribe/', 400,
+            Subscribe.objects.filter(user=self.user),
+            lambda: User.objects.values_list(
+                'followers_count', flat=True).get(pk=self.author.pk))
+
+
+class CacheVersionTests(APITestCase):
+    """Версии кеша меняются только после коммита изменений."""
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_bumped_on_commit(self, prefix, change):
+        before = get_version(prefix)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+            self.assertEqual(get_version(prefix), before)
+        self.assertGreater(get_version(prefix), before)
+
+    def test_tag_version(self):
+        tag = Tag.objects.create(name='tag', slug='tag', color='#fff')
+        tag.name = 'renamed'
+        self.assert_bumped_on_commit('tags', tag.save)
+        self.assert_bumped_on_commit('tags', tag.delete)
+
+    def test_ingredient_version(self):
+        ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г')
+        ingredient.name = 'renamed'
+        self.assert_bumped_on_commit('ingredients', ingredient.save)
+        self.assert_bumped_on_commit('ingredients', ingredient.delete)
+
+
+class PopularityTests(APITestCase):
+    """Удаление давнего события снимает ровно его вклад."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@example.com',
+                password='pass')
+            for i in range(2)
+        ]
+        self.old, self.new = (
+            Recipe.objects.create(
+                author=self.users[0], name=name, text='text', cooking_time=1)
+            for name in ('old', 'new')
+        )
+
+    def score(self, recipe):
+        return RecipePopularity.objects.get(recipe=recipe).score
+
+    def add_long_ago(self, model, user, recipe):
+        with mock.patch('django.utils.timezone.now',
+                        return_value=timezone.now() - timedelta(days=90)):
+            model.objects.create(user=user, recipe=recipe)
+
+    def test_api_remove_old_favorite(self):
+        self.add_long_ago(Favorite, self.users[0], self.old)
+        Favorite.objects.create(user=self.users[1], recipe=self.old)
+        Favorite.objects.create(user=self.users[1], recipe=self.new)
+        self.client.force_authenticate(self.users[0])
+        response = self.client.delete(f'/api/recipes/{self.old.id}/favorite/')
+        self.assertEqual(response.status_code, 204)
+        self.assertAlmostEqual(self.score(self.old), self.score(self.new))
+
+    def test_remove_old_cart_entry(self):
+        self.add_long_ago(ShopingCart, self.users[0], self.old)
+        ShopingCart.objects.create(user=self.users[1], recipe=self.old)
+        ShopingCart.objects.create(user=self.users[1], recipe=self.new)
+        ShopingCart.objects.get(user=self.users[0]).delete()
+        self.assertAlmostEqual(self.score(self.old), self.score(self.new))
+
+    def test_remove_only_event(self):
+        self.add_long_ago(Favorite, self.users[0], self.old)
+        self.client.force_authenticate(self.users[0])
+        self.client.delete(f'/api/recipes/{self.old.id}/favorite/')
+        self.assertEqual(self.score(self.old), NO_POPULARITY)
+
+
+class IngredientAutocompleteTests(APITestCase):
+    """Подсказки ингредиентов отдают ETag и 304, как и весь список."""
+
+    def setUp(self):
+        cache.clear()
+        for name in ('Сахар', 'Сахарная пудра', 'Ванильный сахар', 'Соль'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def test_prefix_then_substring(self):
+        response = self.client.get('/api/ingredients/?name=сах')
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ['Сахар', 'Сахарная пудра', 'Ванильный сахар'])
+
+    def test_etag_round_trip(self):
+        response = self.client.get('/api/ingredients/?name=сах')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(
+            '/api/ingredients/?name=САХ', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            '/api/ingredients/?name=соль', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_new_ingredient_changes_etag(self):
+        etag = self.client.get('/api/ingredients/?name=сах')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Сахарин', measurement_unit='г')
+        response = self.client.get(
+            '/api/ingredients/?name=сах', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Сахарин', [item['name'] for item in response.json()])
+
+
+class IngredientIndexTests(TestCase):
+    """Индекс подсказок находит то же, что и полный перебор каталога."""
+
+    def setUp(self):
+        cache.clear()
+        self.index = IngredientIndex()
+        for name in ('Мука', 'Мука ржаная', 'Сахар', 'Тростниковый сахар',
+                     'Сахарная пудра', 'Масло', 'Масло сливочное',
+                     'Сливочный сыр', 'Сыр'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def full_scan(self, query):
+        names = sorted(
+            Ingredient.objects.values_list('name', flat=True), key=str.lower)
+        query = query.lower()
+        return (
+            [name for name in names if name.lower().startswith(query)]
+            + [name for name in names
+               if query in name.lower()
+               and not name.lower().startswith(query)]
+        )
+
+    def search(self, query, limit=None):
+        return [item['name'] for item in self.index.search(query, limit)]
+
+    def test_matches_full_scan(self):
+        for query in ('с', 'сы', 'сыр', 'сахар', 'СЛИВОЧ', 'ук', 'нет'):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query), self.full_scan(query))
+
+    def test_limit(self):
+        self.assertEqual(self.search('сл', limit=2), self.full_scan('сл')[:2])
+
+    def test_rebuilt_on_version_change(self):
+        self.assertEqual(self.search('сыр'), ['Сыр', 'Сливочный сыр'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.filter(name='Сыр').update(name='Сыр твёрдый')
+            bump_version_on_commit('ingredients')
+        self.assertEqual(self.search('сыр'), ['Сыр твёрдый', 'Сливочный сыр'])
+
+
+class AdminSearchIndexTests(APITestCase):
+    """Правка состава в админке сразу видна в поиске."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first, self.second = (
+                Recipe.objects.create(
+                    author=self.admin, name=name, text='text',
+                    cooking_time=1)
+                for name in ('first', 'second')
+            )
+        self.ingredient = Ingredient.objects.create(
+            name='кардамон', measurement_unit='г')
+        self.client.force_login(self.admin)
+
+    def found(self):
+        response = self.client.get('/api/recipes/?search=кардамон')
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def save_row(self, url, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {
+                'recipe': recipe.id,
+                'ingredient': self.ingredient.id,
+                'amount': 1,
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_add_and_move_ingredient(self):
+        self.assertEqual(self.found(), [])
+        self.save_row('/admin/recipes/recipeingredient/add/', self.first)
+        self.assertEqual(self.found(), [self.first.id])
+        row = RecipeIngredient.objects.get(ingredient=self.ingredient)
+        self.save_row(
+            f'/admin/recipes/recipeingredient/{row.id}/change/', self.second)
+        self.assertEqual(self.found(), [self.second.id])
+
+
+class CounterTests(APITestCase):
+    """Счётчики обновляются при записи и чинятся rebuild_counters."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f'recipe{i}', text='text',
+                cooking_time=1)
+            for i in range(2)
+        ]
+        self.client.force_authenticate(self.user)
+
+    def counters(self):
+        self.author.refresh_from_db()
+        self.recipes[0].refresh_from_db()
+        return (self.author.recipes_count, self.author.followers_count,
+                self.recipes[0].favorites_count)
+
+    def test_write_paths(self):
+        self.assertEqual(self.counters(), (2, 0, 0))
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.client.post(f'/api/recipes/{self.recipes[0].id}/favorite/')
+        self.assertEqual(self.counters(), (2, 1, 1))
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.json()['results'][0]['recipes_count'], 2)
+        self.recipes[1].delete()
+        self.client.delete(f'/api/recipes/{self.recipes[0].id}/favorite/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+    def test_rebuild_counters(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        Subscribe.objects.create(user=self.user, following=self.author)
+        User.objects.update(recipes_count=0, followers_count=7)
+        Recipe.objects.update(favorites_count=5)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(self.counters(), (2, 1, 1))
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0)
+class CursorPaginationTests(APITestCase):
+    """?cursor= обходит выдачу без пропусков и повторов."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass')
+            for i in range(5)
+        ]
+        for i, author in enumerate(self.authors):
+            Recipe.objects.create(
+                author=author, name=f'recipe{i}', text='text',
+                cooking_time=1)
+            Subscribe.objects.create(user=self.user, following=author)
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, during=None):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+            if during:
+                during()
+                during = None
+        return ids
+
+    def test_recipes(self):
+        expected = [
+            recipe['id'] for recipe in
+            self.client.get('/api/recipes/?limit=10').json()['results']
+        ]
+        self.assertEqual(self.walk('/api/recipes/?cursor=&limit=2'),
+                         expected)
+
+    def test_insert_between_pages(self):
+        expected = self.walk('/api/recipes/?cursor=&limit=2')
+        ids = self.walk(
+            '/api/recipes/?cursor=&limit=2',
+            during=lambda: Recipe.objects.create(
+                author=self.user, name='new', text='text', cooking_time=1))
+        self.assertEqual(ids, expected)
+
+    def test_subscriptions(self):
+        self.assertEqual(
+            self.walk('/api/users/subscriptions/?cursor=&limit=2'),
+            [author.id for author in self.authors])
+
+
+class IngredientImportTests(TestCase):
+    """ingredients_csv читает csv и json потоком и не плодит дубликаты."""
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        return path
+
+    def load(self, path, **options):
+        call_command('ingredients_csv', path=path, stdout=StringIO(),
+                     stderr=StringIO(), **options)
+        return dict(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+
+    def test_csv_is_idempotent(self):
+        path = self.write('ingredients.csv', (
+            'name,units\n'
+            'соль,г\n'
+            'сахар,г\n'
+            'соль,г\n'
+            ',г\n'
+            'мука,\n'
+        ))
+        expected = {'соль': 'г', 'сахар': 'г'}
+        self.assertEqual(self.load(path, batch_size=1), expected)
+        self.assertEqual(self.load(path), expected)
+
+    def test_json_read_in_chunks(self):
+        rows = [
+            {'name': f'ингредиент {i}', 'measurement_unit': 'г'}
+            for i in range(20)
+        ]
+        path = self.write('ingredients.json', json.dumps(
+            rows, ensure_ascii=False, indent=2))
+        with mock.patch(
+                'recipes.management.commands.ingredients_csv.'
+                'JSON_CHUNK_SIZE', 7):
+            self.assertEqual(
+                self.load(path, batch_size=3),
+                {row['name']: 'г' for row in rows})
+
+    def test_broken_json(self):
+        for content in ('{}', '[{"name": "соль", "units": "г"}',
+                        '[{"name": "соль", "units": "г"} {}]'):
+            with self.subTest(content=content):
+                with self.assertRaises(CommandError):
+                    self.load(self.write('broken.json', content))
+
+
+class RecipeWriteTests(APITestCase):
+    """Обновление состава рецепта меняет только изменившиеся строки."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.tag = Tag.objects.create(name='tag', slug='tag', color='#fff')
+        self.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient{i}', measurement_unit='г')
+            for i in range(4)
+        ]
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=1)
+        self.recipe.tags.set([self.tag])
+        for ingredient in self.ingredients[:3]:
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=ingredient, amount=1)
+        self.client.force_authenticate(self.author)
+
+    def rows(self):
+        return {
+            row.ingredient_id: (row.id, row.amount)
+            for row in self.recipe.recipeingredient_set.all()
+        }
+
+    def patch(self, data):
+        return self.client.patch(
+            f'/api/recipes/{self.recipe.id}/', data, format='json')
+
+    def ingredients_data(self, *amounts):
+        return {'ingredients': [
+            {'id': ingredient.id, 'amount': amount}
+            for ingredient, amount in zip(self.ingredients, amounts)
+            if amount
+        ]}
+
+    def test_diff_update(self):
+        before = self.rows()
+        first, second, third, fourth = (
+            ingredient.id for ingredient in self.ingredients)
+        response = self.patch(self.ingredients_data(1, 5, 0, 2))
+        self.assertEqual(response.status_code, 200)
+        after = self.rows()
+        self.assertEqual(after.keys(), {first, second, fourth})
+        self.assertEqual(after[first], before[first])
+        self.assertEqual(after[second], (before[second][0], 5))
+        self.assertEqual(after[fourth][1], 2)
+
+    def test_unchanged_ingredients_are_not_written(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch(self.ingredients_data(1, 1, 1))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([
+            query for query in queries
+            if 'recipes_recipeingredient' in query['sql']
+            and not query['sql'].startswith('SELECT')
+        ])
+
+    def test_partial_update_keeps_ingredients(self):
+        before = self.rows()
+        response = self.patch({'name': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(
+            list(self.recipe.tags.values_list('id', flat=True)),
+            [self.tag.id])
+
+    def test_invalid_ingredients(self):
+        first = self.ingredients[0].id
+        for ingredients, message in (
+            ([{'id': first, 'amount': 1}, {'id': first, 'amount': 2}],
+             'Один или несколько ингредиентов повторяются'),
+            ([{'id': first, 'amount': 1}, {'id': 10 ** 6, 'amount': 1}],
+             'Такого ингредиента нет в базе'),
+        ):
+            with self.subTest(message=message):
+                response = self.patch({'ingredients': ingredients})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['ingredients'], [message])
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0)
+class RecipeFilterTests(APITestCase):
+    """Фильтры рецептов не дублируют строки и сочетаются друг с другом."""
+
+    def setUp(self):
+        self.user, self.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass')
+            for name in ('reader', 'author')
+        )
+        self.breakfast, self.dinner = (
+            Tag.objects.create(name=slug, slug=slug, color='#fff')
+            for slug in ('breakfast', 'dinner')
+        )
+        self.both, self.morning, self.other = (
+            Recipe.objects.create(
+                author=author, name=name, text='text', cooking_time=1)
+            for author, name in ((self.author, 'both'),
+                                 (self.author, 'morning'),
+                                 (self.user, 'other'))
+        )
+        self.both.tags.set([self.breakfast, self.dinner])
+        self.morning.tags.set([self.breakfast])
+        Favorite.objects.create(user=self.user, recipe=self.both)
+        ShopingCart.objects.create(user=self.user, recipe=self.morning)
+        self.client.force_authenticate(self.user)
+
+    def ids(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_filters(self):
+        for query, recipes in (
+            ('tags=breakfast&tags=dinner', [self.morning, self.both]),
+            ('tags=dinner', [self.both]),
+            ('tags=unknown', []),
+            (f'author={self.author.id}', [self.morning, self.both]),
+            ('is_favorited=1', [self.both]),
+            ('is_favorited=0', [self.other, self.morning]),
+            ('is_in_shopping_cart=1', [self.morning]),
+            ('is_in_shopping_cart=1&tags=dinner', []),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(
+                    self.ids(query), [recipe.id for recipe in recipes])
+
+    def test_anonymous_user_lists(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.ids('is_favorited=1'), [])
+        self.assertEqual(len(self.ids('is_in_shopping_cart=0')), 3)
+
+
+@override_settings(REPLICA_DATABASE='replica', RECIPE_PAGE_CACHE_TTL=0,
+                   RECIPE_DETAIL_CACHE_TTL=0)
+class ReplicaRouterTests(APITestCase):
+    """Чтение каталога уходит на реплику, данные пользователя — нет."""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+
+    def test_router(self):
+        self.assertIsNone(self.router.db_for_read(Recipe))
+        token = replica_reads.set(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica')
+            self.assertEqual(self.router.db_for_read(Ingredient), 'replica')
+            for model in (Favorite, ShopingCart, ShoppingListItem,
+                          Subscribe):
+                with self.subTest(model=model):
+                    self.assertEqual(
+                        self.router.db_for_read(model), 'default')
+            with primary_reads():
+                self.assertIsNone(self.router.db_for_read(Recipe))
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica')
+        finally:
+            replica_reads.reset(token)
+        self.assertFalse(self.router.allow_migrate('replica', 'recipes'))
+        self.assertIsNone(self.router.allow_migrate('default', 'recipes'))
+
+    def reads_from_replica(self, method, url):
+        """Был ли включён replica_reads, пока запрос читал рецепты."""
+        seen = []
+
+        def filter_queryset(view, queryset):
+            seen.append(replica_reads.get())
+            return queryset
+
+        with mock.patch.object(
+                RecipeViewSet, 'filter_queryset', filter_queryset):
+            getattr(self.client, method)(url)
+        self.assertFalse(replica_reads.get())
+        return seen[0]
+
+    def test_read_actions(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='recipe', text='text', cooking_time=1)
+        self.client.force_authenticate(self.user)
+        self.assertTrue(self.reads_from_replica('get', '/api/recipes/'))
+        self.assertTrue(
+            self.reads_from_replica('get', f'/api/recipes/{recipe.id}/'))
+        self.assertFalse(
+            self.reads_from_replica('get', '/api/recipes/?is_favorited=1'))
+        self.assertFalse(self.reads_from_replica(
+            'delete', f'/api/recipes/{recipe.id}/'))
+
+    @override_settings(RECIPE_DETAIL_CACHE_TTL=60)
+    def test_detail_cache_built_from_primary(self):
+        cache.clear()
+        recipe = Recipe.objects.create(
+            author=self.user, name='recipe', text='text', cooking_time=1)
+        self.assertFalse(
+            self.reads_from_replica('get', f'/api/recipes/{recipe.id}/'))
+
+    @override_settings(REPLICA_DATABASE=None)
+    def test_without_replica(self):
+        self.assertFalse(self.reads_from_replica('get', '/api/recipes/'))
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0)
+class RecipeSearchTests(APITestCase):
+    """?search= ищет по всем полям документа, название весит больше."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.tag = Tag.objects.create(name='завтрак', slug='breakfast',
+                                      color='#fff')
+        self.ingredient = Ingredient.objects.create(
+            name='тыква', measurement_unit='г')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_text, self.in_name, self.in_tag, self.other = (
+                Recipe.objects.create(
+                    author=self.author, name=name, text=text,
+                    cooking_time=1)
+                for name, text in (
+                    ('запеканка', 'тыквенный суп и тыква'),
+                    ('тыква печёная', 'в духовке'),
+                    ('каша', 'на молоке'),
+                    ('салат', 'из овощей'),
+                )
+            )
+            self.in_tag.tags.set([self.tag])
+            RecipeIngredient.objects.create(
+                recipe=self.in_tag, ingredient=self.ingredient, amount=1)
+
+    def found(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_name_ranked_first(self):
+        self.assertEqual(
+            self.found('тыква'),
+            [self.in_name.id, self.in_tag.id, self.in_text.id])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(self.found('каша завтрак'), [self.in_tag.id])
+        self.assertEqual(self.found('каша салат'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for query in ('"', 'тыква OR', 'NEAR(', '*', 'name:каша'):
+            with self.subTest(query=query):
+                self.found(query)
+
+    def test_combined_with_filters(self):
+        self.assertEqual(
+            self.found('тыква', tags='breakfast'), [self.in_tag.id])
+        # Явная сортировка важнее релевантности.
+        self.assertEqual(
+            self.found('тыква', ordering='newest'),
+            [self.in_tag.id, self.in_name.id, self.in_text.id])
+
+    def test_renamed_tag_and_deleted_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'ужин'
+            self.tag.save()
+            self.in_name.delete()
+        self.assertEqual(self.found('ужин'), [self.in_tag.id])
+        self.assertEqual(self.found('завтрак'), [])
+        self.assertEqual(self.found('печёная'), [])
+
+    def test_rebuild_search_index(self):
+        Recipe.objects.filter(id=self.other.id).update(name='рагу')
+        self.assertEqual(self.found('рагу'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('рагу'), [self.other.id])
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=60)
+class AnonymousPageCacheTests(APITestCase):
+    """Страницы для анонимов отдаются из кеша до изменения рецептов."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.tag = Tag.objects.create(name='tag', slug='tag', color='#fff')
+        self.ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=1)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1)
+
+    def get(self, url='/api/recipes/?limit=5&page=1'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_served_from_cache(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.get()
+            self.get('/api/recipes/?page=1&limit=5')
+
+    def test_authenticated_users_bypass_cache(self):
+        self.get()
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get()['results']
+        self.assertTrue(queries)
+        self.assertFalse(results[0]['is_favorited'])
+
+    def assert_invalidated(self, change, check):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        check(self.get()['results'])
+
+    def test_new_recipe(self):
+        self.assert_invalidated(
+            lambda: Recipe.objects.create(
+                author=self.author, name='new', text='text', cooking_time=1),
+            lambda results: self.assertEqual(len(results), 2))
+
+    def test_tags_set(self):
+        self.assert_invalidated(
+            lambda: self.recipe.tags.set([self.tag]),
+            lambda results: self.assertEqual(
+                [tag['slug'] for tag in results[0]['tags']], ['tag']))
+
+    def test_ingredient_renamed(self):
+        self.ingredient.name = 'renamed'
+        self.assert_invalidated(
+            self.ingredient.save,
+            lambda results: self.assertEqual(
+                results[0]['ingredients'][0]['name'], 'renamed'))
+
+    def test_author_renamed(self):
+        self.author.first_name = 'Имя'
+        self.assert_invalidated(
+            self.author.save,
+            lambda results: self.assertEqual(
+                results[0]['author']['first_name'], 'Имя'))
+
+    def test_login_keeps_cache(self):
+        before = get_version('recipes')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.last_login = timezone.now()
+            self.author.save(update_fields=['last_login'])
+        self.assertEqual(get_version('recipes'), before)
+
+
+class ShoppingListTests(APITestCase):
+    """Список покупок совпадает с суммой по рецептам в корзине."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.flour, self.sugar, self.salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'сахар', 'соль')
+        )
+        self.cake, self.bread = (
+            Recipe.objects.create(
+                author=self.user, name=name, text='text', cooking_time=1)
+            for name in ('cake', 'bread')
+        )
+        for recipe, ingredient, amount in (
+            (self.cake, self.flour, 200),
+            (self.cake, self.sugar, 100),
+            (self.bread, self.flour, 500),
+            (self.bread, self.salt, 10),
+        ):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=amount)
+        self.client.force_authenticate(self.user)
+
+    def shopping_list(self):
+        response = self.client.get('/api/recipes/shopping_list/')
+        self.assertEqual(response.status_code, 200)
+        return {item['name']: item['amount'] for item in response.json()}
+
+    def add(self, *recipes):
+        for recipe in recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.id}/shopping_cart/')
+            self.assertEqual(response.status_code, 201)
+
+    def test_cart_changes(self):
+        self.add(self.cake, self.bread)
+        self.assertEqual(self.shopping_list(),
+                         {'мука': 700, 'сахар': 100, 'соль': 10})
+        self.client.delete(f'/api/recipes/{self.cake.id}/shopping_cart/')
+        self.assertEqual(self.shopping_list(), {'мука': 500, 'соль': 10})
+
+    def test_recipe_changes(self):
+        self.add(self.cake, self.bread)
+        response = self.client.patch(
+            f'/api/recipes/{self.cake.id}/', {'ingredients': [
+                {'id': self.flour.id, 'amount': 300},
+                {'id': self.salt.id, 'amount': 5},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.shopping_list(), {'мука': 800, 'соль': 15})
+        self.bread.delete()
+        self.assertEqual(self.shopping_list(), {'мука': 300, 'соль': 5})
+
+    def test_rebuild_shopping_lists(self):
+        self.add(self.cake)
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.create(
+            user=self.user, ingredient=self.salt, amount=1)
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(self.shopping_list(), {'мука': 200, 'сахар': 100})
+
+
+class BulkEndpointTests(APITestCase):
+    """Пакетное добавление и удаление отвечает статусом по каждому id."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.user, name=f'recipe{i}', text='text',
+                cooking_time=1)
+            for i in range(6)
+        ]
+        for recipe in self.recipes:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=10)
+        self.ids = [recipe.id for recipe in self.recipes]
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, url, recipes):
+        response = getattr(self.client, method)(
+            url, {'recipes': recipes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [item['status'] for item in response.json()['results']]
+
+    def test_favorites(self):
+        first, second = self.ids[:2]
+        missing = max(self.ids) + 1
+        url = '/api/recipes/favorite/'
+        self.assertEqual(
+            self.send('post', url, [first, missing, first]),
+            ['added', 'not_found'])
+        self.assertEqual(
+            self.send('post', url, [first, second]), ['exists', 'added'])
+        self.assertEqual(
+            Recipe.objects.get(id=first).favorites_count, 1)
+        self.assertEqual(
+            self.send('delete', url, [second, second, missing]),
+            ['removed', 'not_found'])
+        self.assertEqual(self.send('delete', url, [second]), ['absent'])
+        self.assertEqual(
+            list(Favorite.objects.values_list('recipe_id', flat=True)),
+            [first])
+
+    def test_shopping_cart(self):
+        url = '/api/recipes/shopping_cart/'
+        self.send('post', url, self.ids[:3])
+        self.send('delete', url, self.ids[2:])
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.user).amount, 20)
+
+    def test_constant_queries(self):
+        counts = []
+        for recipes in (self.ids[:1], self.ids[1:]):
+            with CaptureQueriesContext(connection) as queries:
+                self.send('post', '/api/recipes/shopping_cart/', recipes)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_requests(self):
+        too_many = list(range(1, settings.BULK_RECIPES_LIMIT + 2))
+        for recipes in ([], [0], ['a'], too_many):
+            with self.subTest(recipes=recipes):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'recipes': recipes},
+                    format='json')
+                self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': self.ids[:1]},
+            format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0, RECIPE_DETAIL_CACHE_TTL=0)
+class SparseFieldsetTests(APITestCase):
+    """?fields= и ?expand= оставляют в ответе только нужные поля."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.tag = Tag.objects.create(name='tag', slug='tag', color='#fff')
+        self.ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=1)
+        self.recipe.tags.set([self.tag])
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=3)
+        Subscribe.objects.create(user=self.user, following=self.author)
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, status=200):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status)
+        return response.json()
+
+    def test_collapsed_relations(self):
+        recipe = self.get(
+            '/api/recipes/?fields=id,author,tags,ingredients')['results'][0]
+        self.assertEqual(recipe, {
+            'id': self.recipe.id,
+            'author': self.author.id,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 3}],
+        })
+
+    def test_expand(self):
+        recipe = self.get(
+            f'/api/recipes/{self.recipe.id}/'
+            '?fields=name,author,is_favorited&expand=author')
+        self.assertEqual(recipe.keys(), {'name', 'author', 'is_favorited'})
+        self.assertEqual(recipe['author']['username'], 'author')
+        self.assertTrue(recipe['author']['is_subscribed'])
+
+    def test_full_payload_unchanged(self):
+        full = self.get(f'/api/recipes/{self.recipe.id}/')
+        names = ','.join(full)
+        self.assertEqual(
+            self.get(f'/api/recipes/{self.recipe.id}/?fields={names}'
+                     '&expand=author,tags,ingredients'),
+            full)
+
+    def test_subscriptions(self):
+        author = self.get(
+            '/api/users/subscriptions/?fields=id,recipes')['results'][0]
+        self.assertEqual(
+            author, {'id': self.author.id, 'recipes': [self.recipe.id]})
+
+    def test_unknown_fields(self):
+        for path in ('/api/recipes/', f'/api/recipes/{self.recipe.id}/',
+                     '/api/users/subscriptions/'):
+            with self.subTest(path=path):
+                self.assertEqual(
+                    self.get(f'{path}?fields=id,password,secret', status=400),
+                    {'fields': 'Неизвестные поля: password, secret'})
+
+
+class RendererTests(TestCase):
+    """ORJSONRenderer выводит те же байты, что и JSONRenderer DRF."""
+
+    def test_same_output(self):
+        data = {
+            'id': 1,
+            'name': 'Пирог с яблоками',
+            'created': timezone.now(),
+            'day': timezone.now().date(),
+            'price': Decimal('10.50'),
+            'label': gettext_lazy('Избранное'),
+            'tags': [1, 2],
+            'empty': None,
+            1: 'число',
+        }
+        self.assertEqual(
+            ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0)
+class CompressionTests(APITestCase):
+    """Ответы сжимаются кодировкой, которую предпочитает клиент."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'recipe{i}', text='text' * 20,
+                cooking_time=1)
+            ShopingCart.objects.create(user=self.user, recipe=recipe)
+            RecipeIngredient.objects.create(
+                recipe=recipe, amount=1,
+                ingredient=Ingredient.objects.create(
+                    name=f'ingredient{i}', measurement_unit='г'))
+        self.client.force_authenticate(self.user)
+        self.plain = self.client.get('/api/recipes/').content
+
+    def get(self, accept_encoding, url='/api/recipes/', **extra):
+        return self.client.get(
+            url, HTTP_ACCEPT_ENCODING=accept_encoding, **extra)
+
+    def test_choose_encoding(self):
+        for header, encoding in (
+            ('gzip, deflate, br', 'br'),
+            ('gzip', 'gzip'),
+            ('br;q=0.5, gzip', 'gzip'),
+            ('*', 'br'),
+            ('identity', None),
+            ('br;q=0, gzip;q=0', None),
+        ):
+            with self.subTest(header=header):
+                response = self.get(header)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_round_trip(self):
+        for encoding, decompress in (('br', brotli.decompress),
+                                     ('gzip', gzip.decompress)):
+            with self.subTest(encoding=encoding):
+                response = self.get(encoding)
+                self.assertLess(len(response.content), len(self.plain))
+                self.assertEqual(
+                    int(response['Content-Length']), len(response.content))
+                self.assertEqual(decompress(response.content), self.plain)
+
+    def test_small_response_not_compressed(self):
+        response = self.get('gzip', '/api/recipes/?limit=1&fields=id')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_etag_becomes_weak(self):
+        response = self.get('gzip', '/api/ingredients/')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+
+    def test_streamed_download(self):
+        plain = b''.join(self.client.get(
+            '/api/recipes/download_shopping_cart/').streaming_content)
+        response = self.get('gzip', '/api/recipes/download_shopping_cart/')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)), plain)
+
+
+@override_settings(RECIPE_PAGE_CACHE_TTL=0, RECIPE_DETAIL_CACHE_TTL=0)
+class PlainSerializerTests(APITestCase):
+    """Ответы из строк .values() совпадают с ответами DRF байт в байт."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@example.com',
+                password='pass', first_name=f'Имя{i}')
+            for i in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=f'тег{i}', slug=f'tag{i}', color='#fff')
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент{i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, author in enumerate(self.authors * 2):
+                # Нарезка уже «готова», чтобы не запускать фоновые задачи.
+                image = f'recipes/images/{i}.jpg' if i % 2 else ''
+                renditions = {'source': image} if image else {}
+                if i % 3 == 1:
+                    renditions['thumbnail'] = f'recipes/renditions/{i}.webp'
+                recipe = Recipe.objects.create(
+                    author=author, name=f'рецепт {i}', text='текст',
+                    cooking_time=i + 1, image=image, renditions=renditions)
+                recipe.tags.set(tags[:i % 3])
+                for ingredient in ingredients[i % 2:]:
+                    RecipeIngredient.objects.create(
+                        recipe=recipe, ingredient=ingredient, amount=i + 1)
+        self.recipe = recipe
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        ShopingCart.objects.create(user=self.user, recipe=recipe)
+        for author in self.authors[:2]:
+            Subscribe.objects.create(user=self.user, following=author)
+
+    def assert_same(self, url):
+        contents = []
+        for plain in (True, False):
+            with self.settings(PLAIN_READ_SERIALIZERS=plain):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            contents.append(response.content)
+        self.assertEqual(contents[0], contents[1])
+
+    def test_recipes(self):
+        urls = (
+            '/api/recipes/',
+            '/api/recipes/?limit=2&page=2',
+            '/api/recipes/?cursor=&limit=2',
+            '/api/recipes/?tags=tag1&ordering=fastest',
+            f'/api/recipes/?author={self.authors[0].id}',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?search=рецепт',
+            f'/api/recipes/{self.recipe.id}/',
+        )
+        for authenticated in (False, True):
+            self.client.force_authenticate(
+                self.user if authenticated else None)
+            for url in urls:
+                with self.subTest(url=url, authenticated=authenticated):
+                    self.assert_same(url)
+
+    def test_subscriptions(self):
+        self.client.force_authenticate(self.user)
+        for url in ('/api/users/subscriptions/',
+                    '/api/users/subscriptions/?recipes_limit=1',
+                    '/api/users/subscriptions/?cursor=&limit=1'):
+            with self.subTest(url=url):
+                self.assert_same(url)
+
+
+@override_settings(RECIPE_DETAIL_CACHE_TTL=60)
+class DetailCacheTests(APITestCase):
+    """Карточка рецепта берётся из кеша, данные пользователя — из базы."""
+
+    def setUp(self):
+        cache.clear()
+        self.user, self.author = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass')
+            for name in ('reader', 'author')
+        )
+        self.tag = Tag.objects.create(name='tag', slug='tag', color='#fff')
+        self.ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='recipe', text='text', cooking_time=1)
+        self.recipe.tags.set([self.tag])
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1)
+        self.url = f'/api/recipes/{self.recipe.id}/'
+        self.current_user = None
+
+    def get(self, user=None, url=None):
+        # Выход из сессии сам выполняет запросы, поэтому только при смене.
+        if user is not self.current_user:
+            self.client.force_authenticate(user)
+            self.current_user = user
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hits(self):
+        self.get()
+        with self.assertNumQueries(0):
+            self.get()
+        with self.assertNumQueries(1):
+            self.get(self.user)
+
+    def test_same_as_uncached(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Subscribe.objects.create(user=self.user, following=self.author)
+        for user in (None, self.user, self.author):
+            with self.subTest(user=user):
+                with self.settings(RECIPE_DETAIL_CACHE_TTL=0):
+                    expected = self.get(user).content
+                self.get(user)
+                self.assertEqual(self.get(user).content, expected)
+
+    def test_user_flags_not_shared(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.assertTrue(self.get(self.user).json()['is_favorited'])
+        self.assertFalse(self.get(self.author).json()['is_favorited'])
+        self.assertFalse(self.get().json()['is_favorited'])
+        self.get(self.user)
+        self.client.delete(f'{self.url}favorite/')
+        self.assertFalse(self.get(self.user).json()['is_favorited'])
+
+    def assert_invalidated(self, change, check):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        check(self.get().json())
+
+    def test_recipe_updated(self):
+        def change():
+            self.get(self.author)
+            response = self.client.patch(
+                self.url, {'name': 'renamed'}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assert_invalidated(
+            change, lambda data: self.assertEqual(data['name'], 'renamed'))
+
+    def test_ingredient_amount_changed(self):
+        row = RecipeIngredient.objects.get(recipe=self.recipe)
+        row.amount = 5
+        self.assert_invalidated(
+            row.save,
+            lambda data: self.assertEqual(data['ingredients'][0]['amount'],
+                                          5))
+
+    def test_tag_renamed(self):
+        self.tag.name = 'renamed'
+        self.assert_invalidated(
+            self.tag.save,
+            lambda data: self.assertEqual(data['tags'][0]['name'],
+                                          'renamed'))
+
+    def test_tags_cleared_from_tag_side(self):
+        self.assert_invalidated(
+            self.tag.recipes.clear,
+            lambda data: self.assertEqual(data['tags'], []))
+
+    def test_author_renamed(self):
+        self.author.first_name = 'Имя'
+        self.assert_invalidated(
+            self.author.save,
+            lambda data: self.assertEqual(data['author']['first_name'],
+                                          'Имя'))
+
+    def test_deleted(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_bypassed(self):
+        self.get()
+        with CaptureQueriesContext(connection) as queries:
+            self.get(url=f'{self.url}?fields=id,name')
+        self.assertTrue(queries)
+        self.assertEqual(
+            self.client.get('/api/recipes/abc/').status_code, 404)
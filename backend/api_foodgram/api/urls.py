@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (IngredientViewSet, RecipeViewSet, SubscriptionsViewSet,
-                    TagViewSet, subscribe)
+                    TagViewSet, db_metrics, metrics, subscribe)
 
 app_name = 'api'
 
@@ -35,5 +35,7 @@ router_v1.register(
 
 urlpatterns = [
     path('', include(router_v1.urls)),
-    path('users/<int:user_id>/subscribe/', subscribe, name='subscribe')
+    path('users/<int:user_id>/subscribe/', subscribe, name='subscribe'),
+    path('metrics/', metrics, name='metrics'),
+    path('metrics/db/', db_metrics, name='db_metrics'),
 ]
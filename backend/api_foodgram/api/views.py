@@ -1,118 +1,284 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import urlencode
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (Ingredient, Recipe, RecipeIngredient, ShopingCart,
-                            Subscribe, Tag)
+from recipes import bulk
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShopingCart, Subscribe, Tag)
 from rest_framework import filters, mixins, permissions, status, viewsets
-from rest_framework.decorators import action, api_view
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from users.models import User
 
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPageNumberPagination
+from .async_views import AsyncReadMixin, ConcurrentReadMixin
+from .autocomplete import ingredient_index
+from .cache import (AnonymousPageCacheMixin, CachedReadOnlyMixin,
+                    DetailCacheMixin)
+from .db import ReplicaReadMixin, connection_metrics
+from .fieldsets import SparseFieldsetMixin
+from .filters import (IngredientFilter, RecipeFilter, RecipeOrderingFilter,
+                      RecipeSearchFilter)
+from .loaders import UserFlags
+from .metrics import render_metrics
+from .pagination import CustomPageNumberPagination, SubscriptionsPagination
 from .permissions import IsAuthorOrReadOnly
+from .plain_serializers import (PlainReadMixin, PlainRecipeSerializer,
+                                PlainSubscriptionsSerializer)
+from .renderers import (ShoppingListCSVRenderer, ShoppingListJSONRenderer,
+                        ShoppingListTextRenderer)
 from .serializers import (IngredientSerializer, RecipeCreateSerializer,
-                          RecipeSerializer, RecipeShortSerializer,
+                          RecipeIdsSerializer, RecipeSerializer,
+                          RecipeShortSerializer, ShoppingListItemSerializer,
                           SubscribeAuthorSerializer, SubscriptionsSerializer,
                           TagSerializer)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()  #
+class RecipeViewSet(ReplicaReadMixin, AnonymousPageCacheMixin,
+                    DetailCacheMixin, SparseFieldsetMixin, PlainReadMixin,
+                    ConcurrentReadMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.all()
+    primary_params = ('is_favorited', 'is_in_shopping_cart')
+    cache_prefix = 'recipes'
     serializer_class = RecipeSerializer
+    plain_serializer_class = PlainRecipeSerializer
     permission_classes = (IsAuthorOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (
+        DjangoFilterBackend, RecipeSearchFilter, RecipeOrderingFilter)
     filterset_class = RecipeFilter
     pagination_class = CustomPageNumberPagination
 
+    # Столбцы рецепта, которые нужны полям ответа при ?fields=.
+    field_columns = {
+        'name': ('name',),
+        'text': ('text',),
+        'image': ('image',),
+        'images': ('image', 'renditions'),
+    }
+
+    def get_queryset(self):
+        if self.plain_read:
+            return self.get_plain_queryset(self.queryset)
+        fieldset = self.fieldset
+        queryset = self.queryset
+        if fieldset.fields is not None:
+            columns = {'id', 'author', 'cooking_time'}
+            for name in fieldset.fields:
+                columns.update(self.field_columns.get(name, ()))
+            queryset = queryset.only(*columns)
+        if fieldset.expands('author'):
+            queryset = queryset.select_related('author')
+        if fieldset.includes('tags'):
+            queryset = queryset.prefetch_related(
+                'tags' if fieldset.expands('tags')
+                else Prefetch('tags', queryset=Tag.objects.only('id')))
+        if fieldset.includes('ingredients'):
+            ingredients = RecipeIngredient.objects.all()
+            if fieldset.expands('ingredients'):
+                ingredients = ingredients.select_related('ingredient')
+            queryset = queryset.prefetch_related(
+                Prefetch('recipeingredient_set', queryset=ingredients))
+        return queryset
+
+    def get_flag_sources(self):
+        """Нужны ли флаги рецептов и подписки на авторов."""
+        fieldset = self.fieldset
+        return (
+            fieldset.includes('is_favorited')
+            or fieldset.includes('is_in_shopping_cart'),
+            fieldset.expands('author'),
+        )
+
+    def get_related_queries(self, rows):
+        recipes, authors = self.get_flag_sources()
+        return UserFlags.for_request(self.request).queries(
+            recipe_ids=rows.values('id') if recipes else None,
+            author_ids=rows.values('author_id') if authors else None,
+        )
+
+    def set_related_results(self, instances, results):
+        recipes, authors = self.get_flag_sources()
+        if self.plain_read:
+            keys = [(row['id'], row['author_id']) for row in instances]
+        else:
+            keys = [(recipe.id, recipe.author_id) for recipe in instances]
+        UserFlags.for_request(self.request).add(
+            results,
+            recipe_ids=[key[0] for key in keys] if recipes else (),
+            author_ids=[key[1] for key in keys] if authors else (),
+        )
+
+    def add_user_data(self, request, data):
+        """Флаги текущего пользователя поверх карточки рецепта из кеша."""
+        flags = UserFlags.for_request(request)
+        flags.load_recipe(data['id'], data['author']['id'])
+        return {
+            **data,
+            'author': {
+                **data['author'],
+                'is_subscribed': flags.is_subscribed(data['author']['id']),
+            },
+            'is_favorited': flags.is_favorited(data['id']),
+            'is_in_shopping_cart': flags.is_in_shopping_cart(data['id']),
+        }
+
     def get_serializer_class(self):
-        if self.request.method == 'GET':
-            return RecipeSerializer
-        return RecipeCreateSerializer
+        if self.request.method != 'GET':
+            return RecipeCreateSerializer
+        return super().get_serializer_class()
 
     @action(
         detail=True,
         methods=('post', 'delete'),
         permission_classes=(permissions.IsAuthenticated,)
     )
-    def _favorite_cart_post_delete(self, queryset):
-        recipe = self.get_object()
+    def _favorite_cart_post_delete(self, model):
+        recipe = get_object_or_404(Recipe, pk=self.kwargs['pk'])
         if self.request.method == 'DELETE':
-            get_object_or_404(queryset, recipe_id=recipe.id).delete()
+            if not bulk.remove(model, self.request.user.id, [recipe.id]):
+                raise Http404
             return Response(status=status.HTTP_204_NO_CONTENT)
-        if queryset.filter(recipe=recipe).exists():
+        if not bulk.add(model, self.request.user.id, [recipe.id]):
             return Response(
                 'Рецепт уже добавлен', status=status.HTTP_400_BAD_REQUEST)
-        queryset.create(recipe=recipe)
-        serializer = RecipeShortSerializer(recipe, context={
-            'recipe': recipe,
-            'user': self.request.user,
-            'queryset': queryset,
-        })
+        serializer = RecipeShortSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True,
             permission_classes=[permissions.IsAuthenticated],
             methods=['POST', 'DELETE'], )
     def favorite(self, request, pk=None):
-        return self._favorite_cart_post_delete(request.user.favorites)
+        return self._favorite_cart_post_delete(Favorite)
 
     @action(detail=True,
             permission_classes=[permissions.IsAuthenticated],
             methods=['POST', 'DELETE'], )
     def shopping_cart(self, request, pk=None):
-        return self._favorite_cart_post_delete(request.user.cart)
+        return self._favorite_cart_post_delete(ShopingCart)
+
+    def _bulk_post_delete(self, model):
+        serializer = RecipeIdsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        found = set(Recipe.objects.filter(
+            id__in=recipe_ids).values_list('id', flat=True))
+        existing = [
+            recipe_id for recipe_id in recipe_ids if recipe_id in found]
+        if self.request.method == 'DELETE':
+            changed = bulk.remove(model, self.request.user.id, existing)
+            statuses = ('removed', 'absent')
+        else:
+            changed = bulk.add(model, self.request.user.id, existing)
+            statuses = ('added', 'exists')
+        changed = set(changed)
+        return Response({'results': [
+            {
+                'id': recipe_id,
+                'status': 'not_found' if recipe_id not in found
+                else statuses[recipe_id not in changed],
+            }
+            for recipe_id in recipe_ids
+        ]})
+
+    @action(detail=False,
+            permission_classes=[permissions.IsAuthenticated],
+            methods=['POST', 'DELETE'],
+            url_path='favorite',
+            url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        return self._bulk_post_delete(Favorite)
+
+    @action(detail=False,
+            permission_classes=[permissions.IsAuthenticated],
+            methods=['POST', 'DELETE'],
+            url_path='shopping_cart',
+            url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        return self._bulk_post_delete(ShopingCart)
 
     @action(
         detail=False,
         methods=('get',),
-        permission_classes=(permissions.IsAuthenticated,)
+        permission_classes=(permissions.IsAuthenticated,),
+        renderer_classes=(
+            ShoppingListTextRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListJSONRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        shoping_cart = ShopingCart.objects.filter(user=self.request.user)
-        shoping_list = RecipeIngredient.objects.filter(
-            recipe__in=shoping_cart.values('recipe_id')
-        ).values(
-            'ingredient'
-        ).annotate(
-            amount_sum=Sum('amount')
-        )
-
-        add_text = 'Список покупок с сайта Foodgram:\n\n'
-        for item in shoping_list:
-            ingredient = Ingredient.objects.get(id=item['ingredient'])
-            amount_sum = item['amount_sum']
-            add_text += (
-                f'{ingredient.name}, {amount_sum} '
-                f'{ingredient.measurement_unit}\n'
-            )
+        shoping_list = request.user.shopping_list.values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        ).order_by('ingredient__name')
 
-        response = HttpResponse(add_text, content_type="text/plain")
+        renderer = request.accepted_renderer
+        # Под ASGI Django 3.2 читает поток в цикле событий,
+        # где обращаться к базе нельзя.
+        rows = (list(shoping_list) if settings.ASYNC_VIEWS
+                else shoping_list.iterator())
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f'{renderer.media_type}; charset=utf-8',
+        )
         response['Content-Disposition'] = (
-            'attachment; filename=shopping-list.txt'
+            f'attachment; filename=shopping-list.{renderer.format}'
         )
 
         return response
 
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def shopping_list(self, request):
+        items = request.user.shopping_list.select_related(
+            'ingredient').order_by('ingredient__name')
+        return Response(ShoppingListItemSerializer(items, many=True).data)
+
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, AsyncReadMixin, CachedReadOnlyMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    cache_prefix = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.AllowAny,)
     filter_backends = (DjangoFilterBackend, filters.SearchFilter)
     filterset_class = IngredientFilter
-    search_fields = ('name')
+    search_fields = ('name',)
     pagination_class = None
 
+    def get_cache_path(self, request):
+        # Подсказки зависят только от ?name= без учёта регистра.
+        name = request.query_params.get('name')
+        if name:
+            return '{}?{}'.format(
+                request.path, urlencode({'name': name.lower()}))
+        return super().get_cache_path(request)
+
+    def autocomplete(self, request):
+        return Response(
+            ingredient_index.search(request.query_params['name']))
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('name'):
+            return self.cached_response(request, self.autocomplete)
+        return super().list(request, *args, **kwargs)
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(AsyncReadMixin, CachedReadOnlyMixin,
+                 viewsets.ReadOnlyModelViewSet):
+    cache_prefix = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (permissions.AllowAny,)
     filter_backends = (filters.SearchFilter,)
-    search_fields = ('name')
+    search_fields = ('name',)
     pagination_class = None
 
 
@@ -128,32 +294,83 @@ def subscribe(request, user_id):
                 'user': user,
                 'following': following})
         serializer.is_valid(raise_exception=True)
-        Subscribe.objects.create(user=request.user, following=following)
+        if not bulk.subscribe(user.id, following.id):
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY:
+                    ['Вы уже подписаны на этого автора.'],
+            })
         return Response(serializer.data,
                         status=status.HTTP_201_CREATED)
 
-    if not Subscribe.objects.filter(
-        user=user,
-        following=following
-    ).exists():
+    if not bulk.unsubscribe(user.id, following.id):
         return Response(
             'Вы не подписаны на этого автора',
             status=status.HTTP_400_BAD_REQUEST
         )
-    subscription = Subscribe.objects.filter(
-        user=user,
-        following=following
-    )
-
-    subscription.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class SubscriptionsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
-    permissions = (permissions.IsAuthenticated,)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def db_metrics(request):
+    return Response(connection_metrics())
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def metrics(request):
+    return HttpResponse(
+        render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+class SubscriptionsViewSet(SparseFieldsetMixin, PlainReadMixin,
+                           ConcurrentReadMixin, mixins.ListModelMixin,
+                           viewsets.GenericViewSet):
+    permission_classes = (permissions.IsAuthenticated,)
     queryset = Subscribe.objects.all()
     serializer_class = SubscriptionsSerializer
-    pagination_class = LimitOffsetPagination
+    plain_serializer_class = PlainSubscriptionsSerializer
+    pagination_class = SubscriptionsPagination
+    user_columns = (
+        'email', 'username', 'first_name', 'last_name', 'recipes_count')
+    recipe_columns = ('name', 'image', 'renditions', 'cooking_time')
+
+    def get_recipes_limit(self):
+        limit = self.request.query_params.get('recipes_limit')
+        if limit is None or not limit.isdigit():
+            return None
+        return int(limit)
+
+    def get_recent_recipes(self):
+        """Рецепты авторов с учётом recipes_limit."""
+        recipes = Recipe.objects.all()
+        limit = self.get_recipes_limit()
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:limit]
+            ))
+        return recipes
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['recent_recipes'] = self.get_recent_recipes()
+        return context
 
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        users = User.objects.filter(
+            following__user=self.request.user).order_by('id')
+        if self.plain_read:
+            return self.get_plain_queryset(users)
+        fieldset = self.fieldset
+        users = users.only('id', *(
+            name for name in self.user_columns if fieldset.includes(name)))
+        if not fieldset.includes('recipes'):
+            return users
+        recipes = self.get_recent_recipes().only('id', 'author', *(
+            self.recipe_columns if fieldset.expands('recipes') else ()))
+        return users.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='recent_recipes'))
@@ -0,0 +1,44 @@
+"""
+Версии кеша: смена версии префикса делает недействительными все ключи,
+построенные с ней. Нужны и api, и recipes, поэтому лежат вне приложений.
+"""
+import functools
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_version(prefix):
+    return cache.get_or_set(f'{prefix}:version', time.time, None)
+
+
+def bump_version(prefix):
+    cache.set(f'{prefix}:version', time.time(), None)
+
+
+def bump_version_on_commit(prefix):
+    """
+    Меняет версию после коммита: иначе параллельный запрос успеет
+    закешировать под новой версией ещё не закоммиченные данные.
+    """
+    transaction.on_commit(functools.partial(bump_version, prefix))
+
+
+def object_prefix(prefix, pk):
+    """Префикс версии отдельного объекта, например recipes:5."""
+    return f'{prefix}:{pk}'
+
+
+def bump_object_versions(prefix, pks):
+    now = time.time()
+    cache.set_many({
+        f'{object_prefix(prefix, pk)}:version': now for pk in pks
+    }, None)
+
+
+def bump_object_versions_on_commit(prefix, pks):
+    pks = set(pks)
+    if pks:
+        transaction.on_commit(
+            functools.partial(bump_object_versions, prefix, pks))
@@ -0,0 +1,116 @@
+"""
+PostgreSQL с пулом соединений внутри процесса.
+
+Django по-прежнему «закрывает» соединение в конце запроса
+(CONN_MAX_AGE=0), но физически оно возвращается в пул и переиспользуется
+следующим запросом без нового подключения, TLS и аутентификации.
+Размер пула задаётся ключом POOL в настройках базы.
+"""
+import threading
+
+from django.conf import settings
+from django.db.backends.postgresql import base
+from psycopg2 import extras, pool
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    """Ждёт освободившееся соединение вместо немедленной ошибки."""
+
+    def __init__(self, minconn, maxconn, timeout, *args, **kwargs):
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.timeout = timeout
+        self.created = 0
+        self.waits = 0
+        self.timeouts = 0
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        self.created += 1
+        return super()._connect(key)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(blocking=False):
+            self.waits += 1
+            if not self.slots.acquire(timeout=self.timeout):
+                self.timeouts += 1
+                raise pool.PoolError(
+                    'Нет свободных соединений с базой в пуле')
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self.slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.maxconn,
+                'in_use': len(self._used),
+                'idle': len(self._pool),
+                'created': self.created,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+            }
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_pool(self, conn_params=None):
+        with pools_lock:
+            if self.alias not in pools and conn_params is not None:
+                options = self.settings_dict['POOL']
+                pools[self.alias] = ConnectionPool(
+                    options['MIN_SIZE'], options['MAX_SIZE'],
+                    options['TIMEOUT'], **conn_params)
+            return pools.get(self.alias)
+
+    def checkout(self, conn_params):
+        connection_pool = self.get_pool(conn_params)
+        connection = connection_pool.getconn()
+        if settings.DB_HEALTH_CHECKS and not self.ping(connection):
+            connection_pool.putconn(connection, close=True)
+            connection = connection_pool.getconn()
+        return connection
+
+    @staticmethod
+    def ping(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        connection.rollback()
+        return True
+
+    def get_new_connection(self, conn_params):
+        connection = self.checkout(conn_params)
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool().putconn(
+                    self.connection, close=bool(self.connection.closed))
+
+    def pool_stats(self):
+        connection_pool = self.get_pool()
+        return connection_pool.stats() if connection_pool else None
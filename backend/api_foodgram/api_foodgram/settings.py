@@ -1,6 +1,8 @@
 import os
+import tempfile
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -42,6 +44,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Замеры запросов к API: Server-Timing, /api/metrics/ и поиск N+1.
+PERF_INSTRUMENTATION = os.getenv('PERF_INSTRUMENTATION', default='0') == '1'
+PERF_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('PERF_N_PLUS_ONE_THRESHOLD', default=5))
+if PERF_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'api.middleware.PerformanceMiddleware')
+
+# Сжатие ответов brotli/gzip по Accept-Encoding.
+RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', default='1') == '1'
+if RESPONSE_COMPRESSION:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+        'api.middleware.CompressionMiddleware')
+
 ROOT_URLCONF = 'api_foodgram.urls'
 
 TEMPLATES = [
@@ -62,6 +78,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'api_foodgram.wsgi.application'
 
+# wsgi — синхронные воркеры gunicorn, asgi — воркеры uvicorn
+# с асинхронным чтением рецептов, тегов, ингредиентов и подписок.
+SERVER_INTERFACE = os.getenv('SERVER_INTERFACE', default='wsgi')
+ASYNC_VIEWS = SERVER_INTERFACE == 'asgi'
+
 
 # Database
 
@@ -72,10 +93,89 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Постоянные соединения: не подключаться заново на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Для SQLite: файл вместо базы в памяти, нужен тестам
+        # с параллельными запросами (api.tests.ConcurrentWriteTests).
+        'TEST': {'NAME': os.getenv('DB_TEST_NAME')},
     }
 }
 
+# Перед запросом проверять, что постоянное соединение живо, если оно
+# простаивало дольше DB_HEALTH_CHECK_IDLE секунд.
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', default='1') == '1'
+DB_HEALTH_CHECK_IDLE = float(os.getenv('DB_HEALTH_CHECK_IDLE', default=10))
+
+# Пул соединений внутри процесса (только PostgreSQL), 0 — без пула.
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', default=0))
+if DB_POOL_MAX_SIZE and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default'].update(
+        ENGINE='api_foodgram.pool',
+        # Соединение возвращается в пул в конце каждого запроса.
+        CONN_MAX_AGE=0,
+        POOL={
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', default=1)),
+            'MAX_SIZE': DB_POOL_MAX_SIZE,
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+        },
+    )
+
+# Реплика для чтения рецептов и ингредиентов (api.db.ReplicaRouter).
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['api.db.ReplicaRouter']
+REPLICA_DATABASE = 'replica' if 'replica' in DATABASES else None
+
+
+# Cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+    }
+}
+
+CACHE_TTL = int(os.getenv('CACHE_TTL', default=60 * 15))
+
+# Готовые страницы списка рецептов для анонимных пользователей;
+# 0 выключает кеш. Порядок ?ordering=popular обновляется раз в TTL.
+RECIPE_PAGE_CACHE_TTL = int(os.getenv('RECIPE_PAGE_CACHE_TTL', default=60))
+PAGE_CACHE_LOCK_TIMEOUT = float(
+    os.getenv('PAGE_CACHE_LOCK_TIMEOUT', default=5))
+# Карточки рецептов без данных пользователя; сбрасываются по версии
+# рецепта, поэтому срок может быть долгим. 0 выключает кеш.
+RECIPE_DETAIL_CACHE_TTL = int(
+    os.getenv('RECIPE_DETAIL_CACHE_TTL', default=60 * 60))
+
+# Списки и карточки рецептов и подписки без ?fields= собираются из строк
+# .values() в обход полей DRF (api.plain_serializers); 0 выключает.
+PLAIN_READ_SERIALIZERS = os.getenv(
+    'PLAIN_READ_SERIALIZERS', default='1') == '1'
+
+# Сколько рецептов можно добавить в избранное или корзину одним запросом.
+BULK_RECIPES_LIMIT = int(os.getenv('BULK_RECIPES_LIMIT', default=100))
+
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=50))
+
+POPULARITY_HALF_LIFE_DAYS = float(
+    os.getenv('POPULARITY_HALF_LIFE_DAYS', default=7))
+if POPULARITY_HALF_LIFE_DAYS <= 0:
+    raise ImproperlyConfigured(
+        'POPULARITY_HALF_LIFE_DAYS должен быть больше нуля.')
+
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -113,6 +213,11 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 MEDIA_URL = '/backend_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_media')
 
+MAX_IMAGE_SIZE = int(os.getenv('MAX_IMAGE_SIZE', default=5 * 1024 * 1024))
+DATA_UPLOAD_MAX_MEMORY_SIZE = MAX_IMAGE_SIZE * 4 // 3 + 1024 * 1024
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+IMAGE_RENDITION_FORMAT = os.getenv('IMAGE_RENDITION_FORMAT', default='WEBP')
+
 
 # Default primary key field type
 
@@ -132,6 +237,13 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
+    # FAST_JSON_RENDERER=0 возвращает стандартный JSONRenderer.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer'
+        if os.getenv('FAST_JSON_RENDERER', default='1') == '1'
+        else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 DJOSER = {
@@ -1,7 +1,10 @@
+from api_foodgram.cache_versions import bump_object_versions_on_commit
 from django.contrib import admin
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShopingCart, Subscribe, Tag)
+from .search import schedule_index_update
+from .shopping_list import refresh_recipe
 
 
 @admin.register(Subscribe)
@@ -23,17 +26,48 @@ class FavoriteAdmin(admin.ModelAdmin):
 
 
 class RecipesIngredientsAdmin(admin.ModelAdmin):
+    """
+    Состав меняется в обход рецепта, поэтому списки покупок, кеш карточек
+    и поисковый индекс затронутых рецептов обновляются здесь.
+    """
     list_display = ('recipe', 'ingredient', 'amount')
 
+    def recipes_changed(self, recipe_ids):
+        recipe_ids = set(recipe_ids)
+        for recipe_id in recipe_ids:
+            refresh_recipe(recipe_id)
+        bump_object_versions_on_commit('recipes', recipe_ids)
+        schedule_index_update(recipe_ids)
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        recipe_ids = [obj.recipe_id]
+        if 'recipe' in form.changed_data and form.initial.get('recipe'):
+            recipe_ids.append(form.initial['recipe'])
+        self.recipes_changed(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.recipes_changed([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        self.recipes_changed(recipe_ids)
+
 
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'favorite_amount',)
+    list_select_related = ('author',)
     search_fields = ('^name',)
     list_filter = ('author', 'name', 'tags',)
 
-    @admin.display(empty_value='Не добавляли')
+    @admin.display(
+        empty_value='Не добавляли',
+        ordering='favorites_count',
+    )
     def favorite_amount(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     favorite_amount.short_description = 'Сколько раз добавили в избранное'
 
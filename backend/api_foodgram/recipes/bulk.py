@@ -0,0 +1,181 @@
+"""
+Избранное, корзина и подписки: добавление и удаление одним запросом.
+
+Повторы и гонки параллельных запросов разрешают уникальные ограничения
+(INSERT ... ON CONFLICT DO NOTHING и DELETE ... RETURNING; нужны
+PostgreSQL или SQLite 3.35+, версию проверяет recipes.checks),
+а побочные эффекты — счётчики, популярность и список покупок —
+применяются только к строкам, которые действительно изменились.
+Сигналы при этом не отправляются, поэтому их обработчики для одной
+строки вызывают те же функции.
+"""
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from users.models import User
+
+from .models import Favorite, Recipe, RecipeIngredient, ShopingCart, Subscribe
+from .popularity import CART_WEIGHT, FAVORITE_WEIGHT, add_events, remove_events
+from .shopping_list import refresh
+
+
+def favorites_added(user_id, recipe_ids, moment=None):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorites_count=F('favorites_count') + 1)
+    add_events(recipe_ids, FAVORITE_WEIGHT, moment)
+
+
+def favorites_removed(user_id, events):
+    """events — пары (recipe_id, момент добавления)."""
+    Recipe.objects.filter(
+        pk__in=[recipe_id for recipe_id, _ in events], favorites_count__gt=0
+    ).update(favorites_count=F('favorites_count') - 1)
+    remove_events(events, FAVORITE_WEIGHT)
+
+
+def recipes_ingredients(recipe_ids):
+    return list(RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', flat=True).distinct())
+
+
+def cart_added(user_id, recipe_ids, moment=None):
+    add_events(recipe_ids, CART_WEIGHT, moment)
+    refresh([user_id], recipes_ingredients(recipe_ids))
+
+
+def cart_removed(user_id, events, ingredient_ids=None):
+    """events — пары (recipe_id, момент добавления)."""
+    remove_events(events, CART_WEIGHT)
+    if ingredient_ids is None:
+        ingredient_ids = recipes_ingredients(
+            [recipe_id for recipe_id, _ in events])
+    refresh([user_id], ingredient_ids)
+
+
+def subscribed(user_id, following_ids):
+    User.objects.filter(pk__in=following_ids).update(
+        followers_count=F('followers_count') + 1)
+
+
+def unsubscribed(user_id, following_ids):
+    User.objects.filter(
+        pk__in=following_ids, followers_count__gt=0
+    ).update(followers_count=F('followers_count') - 1)
+
+
+EFFECTS = {
+    Favorite: (favorites_added, favorites_removed),
+    ShopingCart: (cart_added, cart_removed),
+}
+
+
+def insert_ignore(model, fields, rows, returning):
+    """
+    INSERT ... ON CONFLICT DO NOTHING одним запросом. Возвращает значения
+    поля returning у действительно вставленных строк: повтор отсекает
+    уникальное ограничение, а не предварительная проверка.
+    """
+    if not rows:
+        return []
+    db = router.db_for_write(model)
+    quote = connections[db].ops.quote_name
+    opts = model._meta
+    prepare = [
+        opts.get_field(name).get_db_prep_save for name in fields]
+    row = '({})'.format(', '.join(['%s'] * len(fields)))
+    sql = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}'
+    with connections[db].cursor() as cursor:
+        cursor.execute(sql.format(
+            quote(opts.db_table),
+            ', '.join(quote(opts.get_field(name).column) for name in fields),
+            ', '.join([row] * len(rows)),
+            quote(opts.get_field(returning).column),
+        ), [
+            prepare[index](value, connections[db])
+            for values in rows for index, value in enumerate(values)
+        ])
+        return [values[0] for values in cursor.fetchall()]
+
+
+def delete_returning(model, user_id, field, values, returning=()):
+    """
+    DELETE ... RETURNING одним запросом; возвращает строки
+    (value, *returning) удалённых записей.
+    """
+    if not values:
+        return []
+    db = router.db_for_write(model)
+    quote = connections[db].ops.quote_name
+    opts = model._meta
+    column = quote(opts.get_field(field).column)
+    with connections[db].cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {} WHERE {} = %s AND {} IN ({}) RETURNING {}'.format(
+                quote(opts.db_table),
+                quote(opts.get_field('user').column),
+                column,
+                ', '.join(['%s'] * len(values)),
+                ', '.join([column, *(
+                    quote(opts.get_field(name).column) for name in returning
+                )]),
+            ),
+            [user_id, *values],
+        )
+        return cursor.fetchall()
+
+
+def parse_moment(value):
+    """Время из RETURNING в обход ORM: SQLite отдаёт строку в UTC."""
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+@transaction.atomic
+def add(model, user_id, recipe_ids):
+    """Добавляет рецепты и возвращает те, которых ещё не было."""
+    moment = timezone.now()
+    inserted = set(insert_ignore(
+        model, ('user', 'recipe', 'created'),
+        [(user_id, recipe_id, moment) for recipe_id in recipe_ids], 'recipe'))
+    added = [recipe_id for recipe_id in recipe_ids if recipe_id in inserted]
+    if added:
+        EFFECTS[model][0](user_id, added, moment)
+    return added
+
+
+@transaction.atomic
+def remove(model, user_id, recipe_ids):
+    """Удаляет рецепты и возвращает те, что действительно были."""
+    deleted = dict(delete_returning(
+        model, user_id, 'recipe', recipe_ids, ('created',)))
+    removed = [
+        (recipe_id, parse_moment(deleted[recipe_id]))
+        for recipe_id in recipe_ids if recipe_id in deleted
+    ]
+    if removed:
+        EFFECTS[model][1](user_id, removed)
+    return [recipe_id for recipe_id, _ in removed]
+
+
+@transaction.atomic
+def subscribe(user_id, following_id):
+    """Подписывает пользователя; False, если подписка уже была."""
+    if not insert_ignore(Subscribe, ('user', 'following'),
+                         [(user_id, following_id)], 'following'):
+        return False
+    subscribed(user_id, [following_id])
+    return True
+
+
+@transaction.atomic
+def unsubscribe(user_id, following_id):
+    """Отменяет подписку; False, если её не было."""
+    if not delete_returning(Subscribe, user_id, 'following', [following_id]):
+        return False
+    unsubscribed(user_id, [following_id])
+    return True
@@ -0,0 +1,23 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.checks import Error, register
+
+MIN_SQLITE_VERSION = (3, 35)
+
+
+@register()
+def sqlite_version_check(app_configs, **kwargs):
+    """
+    recipes.bulk пишет через INSERT ... ON CONFLICT DO NOTHING RETURNING
+    и DELETE ... RETURNING, которые в SQLite появились в версии 3.35.
+    """
+    if sqlite3.sqlite_version_info >= MIN_SQLITE_VERSION or not any(
+            database['ENGINE'] == 'django.db.backends.sqlite3'
+            for database in settings.DATABASES.values()):
+        return []
+    return [Error(
+        f'Нужен SQLite не ниже 3.35, установлен {sqlite3.sqlite_version}.',
+        hint='Обновите SQLite или используйте PostgreSQL.',
+        id='recipes.E001',
+    )]
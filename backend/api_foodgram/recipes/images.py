@@ -0,0 +1,79 @@
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from api_foodgram.cache_versions import bump_object_versions, bump_version
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS,
+    thread_name_prefix='renditions',
+)
+
+
+def render(image, size):
+    """Уменьшает копию изображения; EXIF в результат не переносится."""
+    image = image.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, settings.IMAGE_RENDITION_FORMAT, quality=85)
+    return buffer.getvalue()
+
+
+def make_renditions(recipe_id):
+    try:
+        recipe = Recipe.objects.only('image', 'renditions').get(id=recipe_id)
+        source = recipe.image.name
+        storage = recipe.image.storage
+        with recipe.image.open('rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image = image.convert('RGB')
+        stem = posixpath.splitext(posixpath.basename(source))[0]
+        extension = EXTENSIONS[settings.IMAGE_RENDITION_FORMAT]
+        renditions = {'source': source}
+        for name, size in RENDITIONS.items():
+            renditions[name] = storage.save(
+                f'recipes/renditions/{stem}_{name}.{extension}',
+                ContentFile(render(image, size)),
+            )
+        updated = Recipe.objects.filter(
+            id=recipe_id, image=source
+        ).update(renditions=renditions)
+        if updated:
+            bump_version('recipes')
+            bump_object_versions('recipes', (recipe_id,))
+        stale = recipe.renditions if updated else renditions
+        for name in RENDITIONS:
+            if stale.get(name):
+                storage.delete(stale[name])
+    except Exception:
+        logger.exception('Не удалось подготовить изображения рецепта %s',
+                         recipe_id)
+
+
+def run_in_worker(recipe_id):
+    try:
+        make_renditions(recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_renditions(recipe):
+    """Ставит нарезку изображений в фоновый пул после коммита."""
+    transaction.on_commit(
+        lambda: executor.submit(run_in_worker, recipe.id))
@@ -1,29 +1,156 @@
 import csv
+import json
+from itertools import count, islice
 from pathlib import Path
 
+from api_foodgram.cache_versions import bump_version
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from recipes.models import Ingredient
 
 CSV_DIR = Path(settings.BASE_DIR)
+NAME_MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+class JSONArrayReader:
+    """
+    Разбирает массив по одному элементу через JSONDecoder.raw_decode,
+    подчитывая файл кусками, а не загружая его целиком.
+    """
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ''
+        self.position = 0
+
+    def read_more(self):
+        chunk = self.file.read(JSON_CHUNK_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return bool(chunk)
+
+    def next_char(self):
+        """Первый непробельный символ; позиция остаётся на нём."""
+        while True:
+            self.position = json.decoder.WHITESPACE.match(
+                self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_more():
+                raise CommandError('Файл JSON оборвался до конца массива')
+
+    def decode(self, number):
+        self.next_char()
+        while True:
+            try:
+                row, self.position = self.decoder.raw_decode(
+                    self.buffer, self.position)
+                return row
+            except json.JSONDecodeError as error:
+                if not self.read_more():
+                    raise CommandError(
+                        f'Ошибка JSON в элементе {number}: {error.msg}')
+
+    def __iter__(self):
+        if self.next_char() != '[':
+            raise CommandError('Файл JSON должен содержать массив объектов')
+        self.position += 1
+        if self.next_char() == ']':
+            return
+        for number in count(1):
+            yield self.decode(number)
+            separator = self.next_char()
+            self.position += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise CommandError(
+                    f'Ошибка JSON после элемента {number}: '
+                    'ожидалась запятая')
+
+
+def read_json(file):
+    yield from JSONArrayReader(file)
+
+
+def read_json_lines(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_json_lines,
+}
 
 
 class Command(BaseCommand):
-    help = 'Добавляет данные из файлов csv в базу данных'
+    help = 'Добавляет ингредиенты из файла csv или json в базу данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=CSV_DIR / 'ingredients.csv',
+            type=Path,
+            help='Путь к файлу .csv, .json или .jsonl',
+        )
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='Сколько строк вставлять одним запросом',
+        )
+
+    def parse(self, rows):
+        for number, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                raise CommandError(
+                    f'Строка {number}: ожидался объект, получено {row!r}')
+            name = (row.get('name') or '').strip()
+            unit = (
+                row.get('measurement_unit') or row.get('units') or ''
+            ).strip()
+            if (not name or not unit or len(name) > NAME_MAX_LENGTH
+                    or len(unit) > UNIT_MAX_LENGTH):
+                self.rejected += 1
+                self.stderr.write(f'Строка {number} пропущена: {row}')
+                continue
+            yield Ingredient(name=name, measurement_unit=unit)
 
     def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+
+        self.rejected = 0
+        before = Ingredient.objects.count()
+        processed = 0
+        with open(path, 'r', encoding='utf-8') as file:
+            ingredients = self.parse(reader(file))
+            while True:
+                batch = list(islice(ingredients, options['batch_size']))
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                self.stdout.write(f'Обработано строк: {processed}')
 
-        with open(
-            f'{CSV_DIR}/ingredients.csv',
-            'r',
-            encoding='utf-8'
-        ) as csv_file:
-            r = csv.DictReader(csv_file)
-            for row in r:
-                try:
-                    (Ingredient.objects.get_or_create(
-                        name=row['name'], measurement_unit=row['units']))
-                except Exception:
-                    pass
-
-            print('Done')
+        bump_version('ingredients')
+        created = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Добавлено: {created}, '
+            f'дубликаты: {processed - created}, '
+            f'отклонено: {self.rejected}'
+        ))
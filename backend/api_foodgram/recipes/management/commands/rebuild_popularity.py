@@ -0,0 +1,33 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Favorite, Recipe, RecipePopularity, ShopingCart
+from recipes.popularity import (CART_WEIGHT, FAVORITE_WEIGHT, event_score,
+                                sum_scores)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярности по текущему избранному '
+            'и спискам покупок с учётом времени добавления')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        scores = defaultdict(list)
+        for model, weight in ((Favorite, FAVORITE_WEIGHT),
+                              (ShopingCart, CART_WEIGHT)):
+            events = model.objects.values_list('recipe_id', 'created')
+            for recipe_id, created in events.iterator():
+                scores[recipe_id].append(event_score(weight, created))
+        RecipePopularity.objects.all().delete()
+        created = RecipePopularity.objects.bulk_create(
+            (
+                RecipePopularity(
+                    recipe_id=recipe_id,
+                    score=sum_scores(scores.get(recipe_id)),
+                )
+                for recipe_id in Recipe.objects.values_list('id', flat=True)
+            ),
+            batch_size=1000,
+        )
+        self.stdout.write(f'Пересчитано рецептов: {len(created)}')
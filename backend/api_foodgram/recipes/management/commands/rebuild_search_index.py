@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipe
+from recipes.search import update_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс рецептов'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        update_index()
+        self.stdout.write(
+            f'Проиндексировано рецептов: {Recipe.objects.count()}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+from recipes.models import RecipeIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает списки покупок по текущим корзинам'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        totals = RecipeIngredient.objects.filter(
+            recipe__cart__isnull=False
+        ).order_by().values_list(
+            'recipe__cart__user_id', 'ingredient_id'
+        ).annotate(amount=Sum('amount'))
+        ShoppingListItem.objects.all().delete()
+        created = ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for user_id, ingredient_id, amount in totals.iterator()
+            ),
+            batch_size=1000,
+        )
+        self.stdout.write(f'Пересчитано строк: {len(created)}')
@@ -0,0 +1,88 @@
+# Generated by Django 3.2 on 2026-10-18 18:19
+
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# Копия recipes.popularity на момент миграции: код приложения
+# может меняться, а миграция должна считать так же, как раньше.
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+FAVORITE_WEIGHT = 1.0
+CART_WEIGHT = 0.5
+NO_POPULARITY = -1e9
+
+
+def event_score(weight, moment):
+    half_lives = (
+        (moment - EPOCH).total_seconds()
+        / (settings.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60)
+    )
+    return math.log(weight) + half_lives * math.log(2)
+
+
+def sum_scores(scores):
+    if not scores:
+        return NO_POPULARITY
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def fill_popularity(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipePopularity = apps.get_model('recipes', 'RecipePopularity')
+    scores = defaultdict(list)
+    for name, weight in (('Favorite', FAVORITE_WEIGHT),
+                         ('ShopingCart', CART_WEIGHT)):
+        events = apps.get_model('recipes', name).objects.values_list(
+            'recipe_id', 'created')
+        for recipe_id, created in events.iterator():
+            scores[recipe_id].append(event_score(weight, created))
+    RecipePopularity.objects.bulk_create(
+        (
+            RecipePopularity(
+                recipe_id=recipe_id,
+                score=sum_scores(scores.get(recipe_id)),
+            )
+            for recipe_id in Recipe.objects.values_list('id', flat=True)
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_author_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shopingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Добавлен'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipePopularity',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(default=-1000000000.0, verbose_name='Популярность')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipepopularity',
+            index=models.Index(fields=['-score', '-recipe'], name='popularity_score_idx'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
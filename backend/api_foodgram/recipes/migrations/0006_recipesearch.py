@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-18 18:29
+
+import django.db.models.deletion
+import recipes.models
+from django.db import migrations, models
+from recipes import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_index(schema_editor)
+    search.update_index(db=schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipepopularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearch',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('vector', recipes.models.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -3,6 +3,18 @@ from django.db import models
 from users.models import User
 
 
+class SearchVectorField(models.Field):
+    """
+    Столбец tsvector без django.contrib.postgres, которому нужен psycopg2
+    даже при локальном запуске на SQLite. Заполняется recipes.search.
+    """
+
+    def db_type(self, connection):
+        if connection.vendor == 'postgresql':
+            return 'tsvector'
+        return 'text'
+
+
 class Tag(models.Model):
     name = models.CharField(
         max_length=32,
@@ -88,15 +100,69 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         help_text='Изображение',
     )
+    renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения',
+    )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Сколько раз добавили в избранное',
+    )
 
     class Meta:
         ordering = ['-id']
+        indexes = [
+            models.Index(
+                name='recipe_author_id_idx',
+                fields=['author', '-id'],
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}: {self.text[15:]}...'
 
 
+# Балл популярности рецепта без событий: логарифм нуля.
+NO_POPULARITY = -1e9
+
+
+class RecipePopularity(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name='Рецепт',
+    )
+    score = models.FloatField(
+        default=NO_POPULARITY,
+        verbose_name='Популярность',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                name='popularity_score_idx',
+                fields=['-score', '-recipe'],
+            ),
+        ]
+
+
+class RecipeSearch(models.Model):
+    """Поисковый вектор рецепта для PostgreSQL, см. recipes.search."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name='Рецепт',
+    )
+    vector = SearchVectorField(null=True)
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -151,6 +217,10 @@ class ShopingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='cart'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлен',
+    )
 
     class Meta:
         constraints = [
@@ -161,6 +231,33 @@ class ShopingCart(models.Model):
         ]
 
 
+class ShoppingListItem(models.Model):
+    """
+    Сумма ингредиента по всем рецептам в корзине пользователя,
+    поддерживается recipes.shopping_list.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                name="unique_ShoppingListItem",
+                fields=['user', 'ingredient'],
+            ),
+        ]
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -174,6 +271,10 @@ class Favorite(models.Model):
         on_delete=models.DO_NOTHING,
         related_name='favorites',
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Добавлен',
+    )
 
     class Meta:
         constraints = [
@@ -0,0 +1,116 @@
+"""
+Рейтинг популярности рецептов с затуханием по времени.
+
+Вклад события растёт как 2 ** (t / период полураспада) от фиксированной
+точки отсчёта (forward decay). Поэтому накопленные баллы не пересчитываются
+со временем: их порядок совпадает с порядком баллов, «затухших» к любому
+текущему моменту, и ленту популярного можно отдавать прямо по индексу.
+Хранится натуральный логарифм суммы вкладов, а события складываются
+и вычитаются в логарифмах (log-sum-exp), поэтому баллы не переполняют
+float ни при каком периоде полураспада и сколько бы времени ни прошло.
+Момент события хранится в строке избранного или корзины (created):
+при удалении вычитается ровно тот вклад, который событие когда-то дало.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone as django_timezone
+
+from .models import NO_POPULARITY, RecipePopularity
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+FAVORITE_WEIGHT = 1.0
+CART_WEIGHT = 0.5
+# Ниже exp() даёт 0 в пределах точности float, а PostgreSQL
+# на ещё меньших аргументах выдаёт ошибку underflow.
+MIN_EXPONENT = -700.0
+# Если после вычитания остаётся меньше этой доли балла, это ошибка
+# округления, а не другие события: у рецепта событий больше нет.
+REMOVAL_TOLERANCE = 1e-9
+
+
+def event_score(weight, moment=None):
+    """Логарифм вклада события с весом weight в момент moment."""
+    moment = moment or django_timezone.now()
+    half_lives = (
+        (moment - EPOCH).total_seconds()
+        / (settings.POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60)
+    )
+    return math.log(weight) + half_lives * math.log(2)
+
+
+def sum_scores(scores):
+    """Балл рецепта по логарифмам вкладов его событий."""
+    if not scores:
+        return NO_POPULARITY
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def added_score(score):
+    """ln(e ** балл + e ** score) без переполнения."""
+    score = Value(score, output_field=FloatField())
+    return Greatest(F('score'), score) + Ln(1 + Exp(Greatest(
+        -Abs(F('score') - score), Value(MIN_EXPONENT))))
+
+
+def removed_score(score):
+    """
+    ln(e ** балл - e ** score), где score — число или выражение;
+    если почти ничего не остаётся, у рецепта событий больше нет.
+    """
+    if not hasattr(score, 'resolve_expression'):
+        score = Value(score, output_field=FloatField())
+    return Case(
+        When(
+            score__gt=score - math.log1p(-REMOVAL_TOLERANCE),
+            then=F('score') + Ln(Greatest(
+                1 - Exp(Greatest(score - F('score'), Value(MIN_EXPONENT))),
+                Value(REMOVAL_TOLERANCE))),
+        ),
+        default=Value(NO_POPULARITY),
+        output_field=FloatField(),
+    )
+
+
+def add_event(recipe_id, weight):
+    add_events([recipe_id], weight)
+
+
+def add_events(recipe_ids, weight, moment=None):
+    score = event_score(weight, moment)
+    updated = RecipePopularity.objects.filter(recipe_id__in=recipe_ids).update(
+        score=added_score(score))
+    if updated < len(recipe_ids):
+        present = set(RecipePopularity.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', flat=True))
+        RecipePopularity.objects.bulk_create(
+            (
+                RecipePopularity(recipe_id=recipe_id, score=score)
+                for recipe_id in recipe_ids if recipe_id not in present
+            ),
+            ignore_conflicts=True,
+        )
+
+
+def remove_event(recipe_id, weight, moment):
+    remove_events([(recipe_id, moment)], weight)
+
+
+def remove_events(events, weight):
+    """Вычитает вклады событий, заданных парами (recipe_id, момент)."""
+    scores = {
+        recipe_id: event_score(weight, moment) for recipe_id, moment in events
+    }
+    if not scores:
+        return
+    score = Case(
+        *(When(recipe_id=recipe_id, then=Value(score))
+          for recipe_id, score in scores.items()),
+        output_field=FloatField(),
+    )
+    RecipePopularity.objects.filter(recipe_id__in=scores).update(
+        score=removed_score(score))
@@ -0,0 +1,170 @@
+"""
+Полнотекстовый поиск рецептов по названию, тегам, ингредиентам и описанию.
+
+На PostgreSQL документ хранится в recipes_recipesearch.vector (tsvector
+с весами A — название, B — теги и ингредиенты, C — описание) под
+GIN-индексом, на SQLite — в таблице FTS5 recipes_recipe_fts. Индекс
+обновляется после коммита при сохранении рецепта, тега или ингредиента;
+полностью перестраивается командой rebuild_search_index.
+"""
+from django.db import connection, transaction
+from django.db.models import BooleanField, F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+BATCH_SIZE = 500
+
+AGGREGATED_NAMES = """
+    coalesce((
+        SELECT {aggregate}(tag.name, ' ')
+        FROM recipes_recipetag recipe_tag
+        JOIN recipes_tag tag ON tag.id = recipe_tag.tag_id
+        WHERE recipe_tag.recipe_id = recipe.id
+    ), '') AS tags,
+    coalesce((
+        SELECT {aggregate}(ingredient.name, ' ')
+        FROM recipes_recipeingredient recipe_ingredient
+        JOIN recipes_ingredient ingredient
+            ON ingredient.id = recipe_ingredient.ingredient_id
+        WHERE recipe_ingredient.recipe_id = recipe.id
+    ), '') AS ingredients
+"""
+
+POSTGRESQL_UPDATE = """
+    INSERT INTO recipes_recipesearch (recipe_id, vector)
+    SELECT
+        document.id,
+        setweight(to_tsvector('{config}', document.name), 'A')
+        || setweight(to_tsvector('{config}', document.tags), 'B')
+        || setweight(to_tsvector('{config}', document.ingredients), 'B')
+        || setweight(to_tsvector('{config}', document.text), 'C')
+    FROM (
+        SELECT recipe.id, recipe.name, recipe.text, {names}
+        FROM recipes_recipe recipe
+        {where}
+    ) document
+    ON CONFLICT (recipe_id) DO UPDATE SET vector = EXCLUDED.vector
+"""
+
+SQLITE_UPDATE = """
+    INSERT INTO {table} (rowid, name, tags, ingredients, text)
+    SELECT recipe.id, recipe.name, {names}, recipe.text
+    FROM recipes_recipe recipe
+    {where}
+"""
+
+
+def create_index(schema_editor):
+    """Создаёт структуры поиска под текущую СУБД (вызывается миграцией)."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipe_search_vector_idx '
+            'ON recipes_recipesearch USING gin (vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+            'name, tags, ingredients, text, tokenize = "unicode61")')
+
+
+def drop_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX recipe_search_vector_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {FTS_TABLE}')
+
+
+def update_index(recipe_ids=None, db=connection):
+    """Пересчитывает документы рецептов; без recipe_ids — все."""
+    if recipe_ids is None:
+        update_batch(None, db)
+        return
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        update_batch(recipe_ids[start:start + BATCH_SIZE], db)
+
+
+def update_batch(recipe_ids, db):
+    if recipe_ids == []:
+        return
+    if recipe_ids is None:
+        where, params = '', []
+    else:
+        where = 'WHERE recipe.id IN ({})'.format(
+            ', '.join(['%s'] * len(recipe_ids)))
+        params = list(recipe_ids)
+    with db.cursor() as cursor:
+        if db.vendor == 'postgresql':
+            names = AGGREGATED_NAMES.format(aggregate='string_agg')
+            cursor.execute(POSTGRESQL_UPDATE.format(
+                config=SEARCH_CONFIG, names=names, where=where), params)
+        elif db.vendor == 'sqlite':
+            remove_from_fts(cursor, recipe_ids)
+            names = AGGREGATED_NAMES.format(aggregate='group_concat')
+            cursor.execute(SQLITE_UPDATE.format(
+                table=FTS_TABLE, names=names, where=where), params)
+
+
+def remove_from_fts(cursor, recipe_ids):
+    if recipe_ids is None:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        return
+    cursor.execute(
+        'DELETE FROM {} WHERE rowid IN ({})'.format(
+            FTS_TABLE, ', '.join(['%s'] * len(recipe_ids))),
+        recipe_ids)
+
+
+def remove_from_index(recipe_id):
+    """На PostgreSQL строка удаляется каскадом вместе с рецептом."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            remove_from_fts(cursor, [recipe_id])
+
+
+def schedule_index_update(recipe_ids):
+    transaction.on_commit(lambda: update_index(recipe_ids))
+
+
+class Matches(Func):
+    template = '%(expressions)s'
+    arg_joiner = ' @@ '
+    output_field = BooleanField()
+
+
+def fts_query(query):
+    """Слова запроса в кавычках: FTS5 ищет их все, не разбирая синтаксис."""
+    return ' '.join(
+        '"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+
+def search(queryset, query):
+    """
+    Рецепты, подходящие под запрос, с релевантностью в search_rank
+    (чем больше, тем выше в выдаче).
+    """
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        vector = F('search_document__vector')
+        return queryset.filter(Matches(vector, search_query)).annotate(
+            search_rank=SearchRank(vector, search_query))
+    if vendor == 'sqlite':
+        match = fts_query(query)
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 5.0, 1.0) '
+            f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'AND {FTS_TABLE}.rowid = recipes_recipe.id',
+            (match,), output_field=FloatField(),
+        ))
+    return queryset.filter(
+        Q(name__icontains=query) | Q(text__icontains=query)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
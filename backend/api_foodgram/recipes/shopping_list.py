@@ -0,0 +1,70 @@
+"""
+Список покупок пользователя, сохранённый в ShoppingListItem.
+
+При изменении корзины или состава рецепта пересчитываются только
+затронутые строки: сумма по ингредиенту заново берётся из корзины,
+поэтому результат не зависит от порядка изменений. Строки пользователя
+пересчитываются под блокировкой его записи, чтобы параллельные
+изменения корзины не перезаписали друг друга.
+"""
+from django.db import transaction
+from django.db.models import Sum
+from users.models import User
+
+from .models import RecipeIngredient, ShopingCart, ShoppingListItem
+
+
+def recipe_ingredients(recipe_id):
+    return list(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+
+
+@transaction.atomic
+def refresh(user_ids, ingredient_ids=None):
+    """
+    Пересчитывает строки списков user_ids по ingredient_ids,
+    без ingredient_ids — списки целиком.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids or ingredient_ids == []:
+        return
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids).order_by('pk').values_list('pk'))
+    items = ShoppingListItem.objects.filter(user_id__in=user_ids)
+    sources = RecipeIngredient.objects.filter(
+        recipe__cart__user_id__in=user_ids)
+    if ingredient_ids is not None:
+        items = items.filter(ingredient_id__in=ingredient_ids)
+        sources = sources.filter(ingredient_id__in=ingredient_ids)
+    totals = {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in sources.order_by().values_list(
+            'recipe__cart__user_id', 'ingredient_id'
+        ).annotate(amount=Sum('amount'))
+    }
+    changed, removed = [], []
+    for item in items:
+        amount = totals.pop((item.user_id, item.ingredient_id), None)
+        if amount is None:
+            removed.append(item.pk)
+        elif amount != item.amount:
+            item.amount = amount
+            changed.append(item)
+    if removed:
+        ShoppingListItem.objects.filter(pk__in=removed).delete()
+    if changed:
+        ShoppingListItem.objects.bulk_update(changed, ('amount',))
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+        for (user_id, ingredient_id), amount in totals.items()
+    )
+
+
+def refresh_recipe(recipe_id, ingredient_ids=None):
+    """Пересчитывает списки всех, у кого рецепт в корзине."""
+    refresh(
+        ShopingCart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True),
+        ingredient_ids,
+    )
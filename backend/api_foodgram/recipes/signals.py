@@ -0,0 +1,101 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import User
+
+from .bulk import (cart_added, cart_removed, favorites_added,
+                   favorites_removed, subscribed, unsubscribed)
+from .images import schedule_renditions
+from .models import (Favorite, Ingredient, Recipe, RecipePopularity,
+                     ShopingCart, Subscribe, Tag)
+from .search import remove_from_index, schedule_index_update
+from .shopping_list import recipe_ingredients
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        favorites_added(
+            instance.user_id, [instance.recipe_id], instance.created)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    favorites_removed(
+        instance.user_id, [(instance.recipe_id, instance.created)])
+
+
+@receiver(post_save, sender=ShopingCart)
+def cart_created(sender, instance, created, **kwargs):
+    if created:
+        cart_added(instance.user_id, [instance.recipe_id], instance.created)
+
+
+@receiver(pre_delete, sender=ShopingCart)
+def cart_deleting(sender, instance, **kwargs):
+    # При удалении рецепта его состав может исчезнуть раньше корзины.
+    instance.ingredient_ids = recipe_ingredients(instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShopingCart)
+def cart_deleted(sender, instance, **kwargs):
+    cart_removed(
+        instance.user_id, [(instance.recipe_id, instance.created)],
+        instance.ingredient_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1)
+        RecipePopularity.objects.create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    if (instance.image
+            and instance.renditions.get('source') != instance.image.name):
+        schedule_renditions(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved_search(sender, instance, **kwargs):
+    schedule_index_update([instance.id])
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_index_update(
+            instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_index_update(
+            instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted_search(sender, instance, **kwargs):
+    remove_from_index(instance.id)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    User.objects.filter(
+        pk=instance.author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribe_created(sender, instance, created, **kwargs):
+    if created:
+        subscribed(instance.user_id, [instance.following_id])
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscribe_deleted(sender, instance, **kwargs):
+    unsubscribed(instance.user_id, [instance.following_id])
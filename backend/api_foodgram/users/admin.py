@@ -9,6 +9,7 @@ class UserAdmin(DefaultUserAdmin):
     '''Админка для модели пользователей'''
     list_display = (
         'username', 'pk', 'email', 'password', 'first_name', 'last_name',
+        'recipes_count', 'followers_count',
     )
     list_editable = ('password', )
     list_filter = ('username', 'email')